@@ -1,33 +1,63 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 import structlog
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timezone
+from typing import List, Optional, Set
 import asyncio
 import os
-from pydantic import BaseModel
+import aiofiles
+from pydantic import BaseModel, TypeAdapter
 
+from backend.app.core.config import get_settings
 from backend.services import storage
-from core.models import RunStatus
+from core.models import Run, RunStatus
 from core.orchestration import orchestrator
 
 logger = structlog.get_logger()
 
 router = APIRouter()
 
+# Serializes run lists straight to JSON bytes
+_RUN_LIST_ADAPTER = TypeAdapter(List[Run])
+
+# Caps agent workflows running at once; the rest wait for a slot
+_RUN_SLOTS = asyncio.Semaphore(get_settings().max_concurrent_runs)
+
+# Runs accepted but not finished ("pending") and those holding a slot ("running")
+_run_counts = {"pending": 0, "running": 0}
+
+# Background agent tasks, referenced here so they aren't garbage collected
+_run_tasks: Set[asyncio.Task] = set()
+
 class RunCreateRequest(BaseModel):
     idea: str
 
 @router.post("/runs")
-async def create_run(request: RunCreateRequest, background_tasks: BackgroundTasks):
+async def create_run(request: RunCreateRequest):
     """Create a new run with a product idea."""
     if not request.idea or len(request.idea.strip()) == 0:
         raise HTTPException(status_code=400, detail="Idea cannot be empty")
     
+    # Shed load once every slot is busy and the wait queue is full; the slot is
+    # reserved before any await, so a burst of requests can't all pass the check
+    settings = get_settings()
+    if _run_counts["pending"] >= settings.max_concurrent_runs + settings.max_queued_runs:
+        logger.warning("Run rejected, too many runs in progress", **_run_counts)
+        raise HTTPException(status_code=429, detail="Too many runs in progress, try again later")
+    _run_counts["pending"] += 1
+    
     # Create run in storage
-    run = storage.create_run(request.idea.strip())
+    try:
+        run = await storage.create_run_async(request.idea.strip())
+    except BaseException:
+        _run_counts["pending"] -= 1
+        raise
     
-    # Run agents in background
-    background_tasks.add_task(run_agents_background, run.id)
+    # Run agents in background; the task releases the reservation when it ends,
+    # whether or not the client is still connected
+    task = asyncio.create_task(run_agents_background(run.id))
+    _run_tasks.add(task)
+    task.add_done_callback(_run_finished)
     
     logger.info("Run created", run_id=run.id, idea=request.idea)
     
@@ -37,40 +67,67 @@ async def create_run(request: RunCreateRequest, background_tasks: BackgroundTask
         "artifacts": run.artifacts
     }
 
+def _not_modified(request: Request, etag: str) -> bool:
+    """Check whether the client already holds the representation with this ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
 @router.get("/runs/{run_id}")
-async def get_run(run_id: str):
+async def get_run(run_id: str, request: Request):
     """Get run details and artifacts."""
-    run = storage.get_run(run_id)
+    run = await storage.get_run_async(run_id)
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
     
-    return run.dict()
+    # Pollers that already have the current state get a 304 with no body
+    etag = f'W/"{run.id}-{run.status.value}-{int(run.updated_at.timestamp() * 1_000_000)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=2"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=run.model_dump_json(), media_type="application/json", headers=headers)
+
+def _bundle_is_current(run: Run, bundle_path: str) -> bool:
+    """Check whether a saved bundle was built after the run completed."""
+    # Bundles built before completion (older versions wrote one on every
+    # download) may lack the final artifacts, so they are rebuilt
+    if not run.completed_at:
+        return False
+    try:
+        mtime = os.stat(bundle_path).st_mtime
+    except OSError:
+        return False
+    return mtime >= run.completed_at.replace(tzinfo=timezone.utc).timestamp()
 
 @router.get("/runs/{run_id}/download")
 async def download_run(run_id: str):
     """Download zip bundle of run artifacts."""
-    run = storage.get_run(run_id)
+    run = await storage.get_run_async(run_id)
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
     
-    # Create bundle if it doesn't exist
-    bundle_path = storage.create_bundle(run_id)
-    if not bundle_path:
-        raise HTTPException(status_code=500, detail="Failed to create bundle")
+    # Completed runs no longer change, so build their bundle once and serve the
+    # file directly, letting the server send it from the page cache
+    if run.status == RunStatus.COMPLETED:
+        bundle_path = run.get_artifact_path("bundle")
+        if not _bundle_is_current(run, bundle_path):
+            bundle_path = await storage.create_bundle_async(run_id)
+        if bundle_path:
+            return FileResponse(bundle_path, media_type="application/zip", filename=f"{run_id}.zip")
     
-    # In a real implementation, we would return the file
-    # For now, return the path
-    return {
-        "message": "Bundle created successfully",
-        "run_id": run_id,
-        "bundle_path": bundle_path,
-        "download_url": f"/api/v1/runs/{run_id}/bundle/file"
-    }
+    # Stream the bundle straight to the client instead of building it on disk
+    return StreamingResponse(
+        storage.iter_bundle(run_id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={run_id}.zip"}
+    )
 
 @router.get("/runs/{run_id}/artifacts/{artifact_type}")
-async def get_artifact(run_id: str, artifact_type: str):
-    """Get an artifact file for a run."""
-    run = storage.get_run(run_id)
+async def get_artifact(run_id: str, artifact_type: str, request: Request, wrap: bool = False):
+    """Get an artifact file for a run (text artifacts as JSON when wrap is set)."""
+    run = await storage.get_run_async(run_id)
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
     
@@ -99,36 +156,53 @@ async def get_artifact(run_id: str, artifact_type: str):
         media_type = "application/octet-stream"
         filename = os.path.basename(artifact_path)
     
-    # Read file
-    try:
-        with open(artifact_path, 'rb') as f:
-            content = f.read()
+    # Artifacts change only when rewritten, so the file's stat identifies the version
+    stat = os.stat(artifact_path)
+    etag = f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-wrap" if wrap else ""}"'
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # For text files, wrap in a JSON response when asked
+    if wrap and artifact_type in ("prd_markdown", "conversation"):
+        try:
+            async with aiofiles.open(artifact_path, 'r', encoding='utf-8') as f:
+                content = await f.read()
+        except Exception as e:
+            logger.error("Failed to read artifact", run_id=run_id, artifact_type=artifact_type, error=str(e))
+            raise HTTPException(status_code=500, detail=f"Failed to read artifact: {str(e)}")
         
-        # For text files, decode for JSON response
-        if artifact_type == "prd_markdown" or artifact_type == "conversation":
-            content = content.decode('utf-8')
-            return {
+        return JSONResponse(
+            content={
                 "run_id": run_id,
                 "artifact_type": artifact_type,
                 "content": content,
                 "filename": filename
-            }
-        else:
-            # For binary files (PDF, etc.), return as FileResponse
-            from fastapi.responses import FileResponse
-            return FileResponse(
-                path=artifact_path,
-                media_type=media_type,
-                filename=filename
-            )
-    except Exception as e:
-        logger.error("Failed to read artifact", run_id=run_id, artifact_type=artifact_type, error=str(e))
-        raise HTTPException(status_code=500, detail=f"Failed to read artifact: {str(e)}")
+            },
+            headers={"ETag": etag}
+        )
+    
+    # Otherwise serve the file as-is; FileResponse streams it from disk
+    return FileResponse(
+        path=artifact_path,
+        media_type=media_type,
+        filename=filename,
+        headers={"ETag": etag}
+    )
+
+def _run_finished(task: asyncio.Task):
+    """Release a finished background run's reservation."""
+    _run_tasks.discard(task)
+    _run_counts["pending"] -= 1
 
 async def run_agents_background(run_id: str):
-    """Run agents in background task."""
+    """Run agents in background task once a run slot is free."""
     try:
-        await orchestrator.run_agents(run_id)
+        async with _RUN_SLOTS:
+            _run_counts["running"] += 1
+            try:
+                await orchestrator.run_agents(run_id)
+            finally:
+                _run_counts["running"] -= 1
         logger.info("Background agents completed", run_id=run_id)
     except Exception as e:
         logger.error("Background agents failed", run_id=run_id, error=str(e))
@@ -136,5 +210,5 @@ async def run_agents_background(run_id: str):
 @router.get("/runs")
 async def list_runs(limit: int = 20, offset: int = 0):
     """List recent runs."""
-    runs = storage.list_runs(limit=limit, offset=offset)
-    return [run.dict() for run in runs]
+    runs = await storage.list_runs_async(limit=limit, offset=offset)
+    return Response(content=_RUN_LIST_ADAPTER.dump_json(runs), media_type="application/json")
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from functools import lru_cache
 from typing import Optional
 import os
 
@@ -9,6 +10,7 @@ class Settings(BaseSettings):
     openai_api_key: str = "your_openai_api_key_here"
     openai_model: str = "gpt-4-turbo-preview"
     openai_base_url: str = "https://api.openai.com/v1"
+    openai_prompt_cache_key: Optional[bool] = None  # Send prompt_cache_key; unset means only to api.openai.com
     
     # Application Configuration
     environment: str = "development"
@@ -25,11 +27,16 @@ class Settings(BaseSettings):
     # Agent Configuration
     agent_seed: int = 42
     max_strategist_questions: int = 5
+    stub_latency_seconds: float = 0.0  # Simulated response time of the stub LLM
     prd_template_path: str = "./core/prompts/templates.py"
+    max_concurrent_runs: int = 4  # Agent workflows running at once
+    max_queued_runs: int = 16  # Accepted runs waiting for a slot before returning 429
     
     class Config:
         env_file = ".env"
         case_sensitive = False
 
-# Global settings instance
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Get the settings, parsing the environment and .env once per process."""
+    return Settings()
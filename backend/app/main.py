@@ -1,9 +1,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import structlog
+import asyncio
 
 from backend.app.api import runs, health
-from backend.app.core.config import settings
+from backend.services import storage, start_cpu_pool, shutdown_cpu_pool
+from core.llm_client import close_http_session
+from core.orchestration import orchestrator
 
 # Configure structured logging
 logger = structlog.get_logger()
@@ -41,8 +44,15 @@ async def root():
 async def startup_event():
     """Initialize application on startup."""
     logger.info("Starting AI Product Manager API", version="1.0.0")
+    app.state.cpu_pool = start_cpu_pool()
+    
+    # Warm up the LLM connection in the background so startup isn't delayed
+    app.state.llm_warmup = asyncio.create_task(orchestrator.warmup())
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown."""
     logger.info("Shutting down AI Product Manager API")
+    shutdown_cpu_pool()
+    await storage.close()
+    await close_http_session()
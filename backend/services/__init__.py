@@ -1,5 +1,14 @@
 # Services package
 from .storage import StorageService, storage
 from .pdf_generator import PDFGenerator, pdf_generator
+from .executor import start_cpu_pool, shutdown_cpu_pool, run_cpu_bound
 
-__all__ = ["StorageService", "storage", "PDFGenerator", "pdf_generator"]
+__all__ = [
+    "StorageService",
+    "storage",
+    "PDFGenerator",
+    "pdf_generator",
+    "start_cpu_pool",
+    "shutdown_cpu_pool",
+    "run_cpu_bound",
+]
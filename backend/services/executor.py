@@ -0,0 +1,54 @@
+"""Process pool for CPU-bound work that must stay off the event loop."""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+import structlog
+
+logger = structlog.get_logger()
+
+# Pending jobs allowed per worker before callers wait for a free slot
+QUEUE_DEPTH_PER_WORKER = 2
+
+_pool: Optional[ProcessPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+def start_cpu_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Start the shared process pool."""
+    global _pool, _slots
+    
+    max_workers = max_workers or os.cpu_count() or 1
+    # Workers start lazily, once the app already has threads that may hold locks
+    # (logging, aiofiles, the Markdown converter); forking then can deadlock a
+    # worker, so start them from a clean server process instead
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(start_method))
+    _slots = asyncio.Semaphore(max_workers * QUEUE_DEPTH_PER_WORKER)
+    
+    logger.info("CPU pool started", max_workers=max_workers, start_method=start_method)
+    return _pool
+
+def shutdown_cpu_pool():
+    """Shut down the shared process pool."""
+    global _pool, _slots
+    
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+        _slots = None
+        logger.info("CPU pool stopped")
+
+async def run_cpu_bound(func: Callable[..., Any], *args: Any) -> Any:
+    """Run a picklable callable in the process pool."""
+    loop = asyncio.get_running_loop()
+    
+    # Without a started pool (tests, scripts) fall back to the default thread pool
+    if _pool is None:
+        return await loop.run_in_executor(None, func, *args)
+    
+    # Bound submissions so a burst waits here instead of piling up in the
+    # executor's unbounded work queue
+    async with _slots:
+        return await loop.run_in_executor(_pool, func, *args)
@@ -1,21 +1,163 @@
 """PDF generation service for PRDs."""
 
 import os
+import re
 import tempfile
+import threading
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 import structlog
 from datetime import datetime
 
-from backend.app.core.config import settings
+from backend.app.core.config import get_settings
 
 logger = structlog.get_logger()
 
+# ReportLab is imported once at module load (and once per CPU pool worker),
+# not on every PDF
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    _HAS_REPORTLAB = True
+    
+    # Document factory with the PRD page layout; only the output path varies
+    _new_document = partial(
+        SimpleDocTemplate,
+        pagesize=letter,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72
+    )
+except ImportError:
+    _HAS_REPORTLAB = False
+
+# Markdown converter shared across PDFs; reset() between documents instead of
+# rebuilding the parser and its extension config on every call
+try:
+    import markdown
+    _MD = markdown.Markdown(extensions=['extra'])
+except ImportError:
+    _MD = None
+_MD_LOCK = threading.Lock()
+
+# ATX headings up to level 3; deeper headings are treated as body text
+_HEADING_RE = re.compile(r'^[ \t]*(#{1,3})[ \t]+(\S.*?)[ \t\r]*$', re.MULTILINE)
+
+def _markdown_to_html(markdown_content: str) -> str:
+    """Convert Markdown to HTML with the shared converter."""
+    if _MD is None:
+        raise ImportError("markdown is not installed")
+    with _MD_LOCK:
+        return _MD.reset().convert(markdown_content)
+
+# Static HTML document shell; only the timestamp and body vary per PDF
+_HTML_SHELL = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Product Requirements Document</title>
+    <style>
+        body {{
+            font-family: Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+            max-width: 800px;
+            margin: 0 auto;
+            padding: 20px;
+        }}
+        h1 {{
+            color: #1E3A8A;
+            border-bottom: 2px solid #E5E7EB;
+            padding-bottom: 10px;
+        }}
+        h2 {{
+            color: #374151;
+            margin-top: 30px;
+        }}
+        h3 {{
+            color: #4B5563;
+        }}
+        .footer {{
+            margin-top: 50px;
+            padding-top: 20px;
+            border-top: 1px solid #E5E7EB;
+            color: #6B7280;
+            font-size: 0.9em;
+            text-align: center;
+        }}
+        .generation-info {{
+            color: #6B7280;
+            font-style: italic;
+            margin-bottom: 30px;
+        }}
+    </style>
+</head>
+<body>
+    <h1>Product Requirements Document</h1>
+    <div class="generation-info">
+        Generated on {generation_time}
+    </div>
+    {html_content}
+    <div class="footer">
+        Generated by AI Product Manager (AutoGen)
+    </div>
+</body>
+</html>
+"""
+
+@lru_cache(maxsize=1)
+def _build_styles() -> Dict[str, "ParagraphStyle"]:
+    """Build the ReportLab paragraph styles once per process."""
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            spaceAfter=30,
+            textColor=colors.HexColor('#1E3A8A')
+        ),
+        'heading1': ParagraphStyle(
+            'CustomHeading1',
+            parent=styles['Heading1'],
+            fontSize=18,
+            spaceAfter=12,
+            textColor=colors.HexColor('#374151')
+        ),
+        'heading2': ParagraphStyle(
+            'CustomHeading2',
+            parent=styles['Heading2'],
+            fontSize=14,
+            spaceAfter=8,
+            textColor=colors.HexColor('#4B5563')
+        ),
+        'normal': ParagraphStyle(
+            'CustomNormal',
+            parent=styles['Normal'],
+            fontSize=11,
+            spaceAfter=6,
+            textColor=colors.HexColor('#1F2937')
+        ),
+        'footer': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=colors.gray,
+            alignment=1  # Center
+        ),
+    }
+
 class PDFGenerator:
     """Generate PDF files from Markdown PRDs."""
     
     def __init__(self, generator_type: Optional[str] = None):
-        self.generator_type = generator_type or settings.pdf_generator
+        self.generator_type = generator_type or get_settings().pdf_generator
     
     def generate_from_markdown(self, markdown_content: str, output_path: str) -> bool:
         """Generate PDF from Markdown content."""
@@ -36,60 +178,20 @@ class PDFGenerator:
     
     def _generate_with_reportlab(self, markdown_content: str, output_path: str) -> bool:
         """Generate PDF using ReportLab."""
+        if not _HAS_REPORTLAB:
+            logger.warning("ReportLab not installed, falling back to HTML method")
+            return self._generate_with_html(markdown_content, output_path)
+        
         try:
-            from reportlab.lib.pagesizes import letter
-            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.lib.units import inch
-            from reportlab.lib import colors
-            import markdown
-            
-            # Convert markdown to HTML then to plain text for ReportLab
-            html_content = markdown.markdown(markdown_content)
-            
             # Create PDF document
-            doc = SimpleDocTemplate(
-                output_path,
-                pagesize=letter,
-                rightMargin=72,
-                leftMargin=72,
-                topMargin=72,
-                bottomMargin=72
-            )
-            
-            # Create styles
-            styles = getSampleStyleSheet()
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=24,
-                spaceAfter=30,
-                textColor=colors.HexColor('#1E3A8A')
-            )
-            
-            heading1_style = ParagraphStyle(
-                'CustomHeading1',
-                parent=styles['Heading1'],
-                fontSize=18,
-                spaceAfter=12,
-                textColor=colors.HexColor('#374151')
-            )
-            
-            heading2_style = ParagraphStyle(
-                'CustomHeading2',
-                parent=styles['Heading2'],
-                fontSize=14,
-                spaceAfter=8,
-                textColor=colors.HexColor('#4B5563')
-            )
+            doc = _new_document(output_path)
             
-            normal_style = ParagraphStyle(
-                'CustomNormal',
-                parent=styles['Normal'],
-                fontSize=11,
-                spaceAfter=6,
-                textColor=colors.HexColor('#1F2937')
-            )
+            # Get cached styles
+            styles = _build_styles()
+            title_style = styles['title']
+            heading1_style = styles['heading1']
+            heading2_style = styles['heading2']
+            normal_style = styles['normal']
             
             # Build story (content)
             story = []
@@ -104,63 +206,38 @@ class PDFGenerator:
             story.append(Paragraph(gen_info, normal_style))
             story.append(Spacer(1, 0.3 * inch))
             
-            # Parse markdown and add content
-            lines = markdown_content.split('\n')
-            current_section = []
-            
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                if line.startswith('# '):
-                    # Title
-                    if current_section:
-                        story.append(Paragraph(' '.join(current_section), normal_style))
-                        current_section = []
-                    story.append(Paragraph(line[2:], title_style))
-                    story.append(Spacer(1, 0.2 * inch))
-                elif line.startswith('## '):
-                    # Heading 1
-                    if current_section:
-                        story.append(Paragraph(' '.join(current_section), normal_style))
-                        current_section = []
-                    story.append(Paragraph(line[3:], heading1_style))
-                    story.append(Spacer(1, 0.1 * inch))
-                elif line.startswith('### '):
-                    # Heading 2
-                    if current_section:
-                        story.append(Paragraph(' '.join(current_section), normal_style))
-                        current_section = []
-                    story.append(Paragraph(line[4:], heading2_style))
-                    story.append(Spacer(1, 0.05 * inch))
-                else:
-                    # Normal text
-                    current_section.append(line)
+            # Parse markdown and add content: text between headings becomes
+            # one paragraph, headings pick their style by level
+            heading_styles = {
+                1: (title_style, 0.2 * inch),
+                2: (heading1_style, 0.1 * inch),
+                3: (heading2_style, 0.05 * inch),
+            }
+            last_end = 0
+            for match in _HEADING_RE.finditer(markdown_content):
+                paragraph = ' '.join(markdown_content[last_end:match.start()].split())
+                if paragraph:
+                    story.append(Paragraph(paragraph, normal_style))
+                style, space = heading_styles[len(match.group(1))]
+                story.append(Paragraph(match.group(2), style))
+                story.append(Spacer(1, space))
+                last_end = match.end()
             
             # Add any remaining text
-            if current_section:
-                story.append(Paragraph(' '.join(current_section), normal_style))
+            paragraph = ' '.join(markdown_content[last_end:].split())
+            if paragraph:
+                story.append(Paragraph(paragraph, normal_style))
             
             # Add footer
             story.append(Spacer(1, 0.5 * inch))
             footer = "Generated by AI Product Manager (AutoGen)"
-            story.append(Paragraph(footer, ParagraphStyle(
-                'Footer',
-                parent=styles['Normal'],
-                fontSize=9,
-                textColor=colors.gray,
-                alignment=1  # Center
-            )))
+            story.append(Paragraph(footer, styles['footer']))
             
             # Build PDF
             doc.build(story)
             logger.info("PDF generated successfully with ReportLab", output_path=output_path)
             return True
             
-        except ImportError:
-            logger.warning("ReportLab not installed, falling back to HTML method")
-            return self._generate_with_html(markdown_content, output_path)
         except Exception as e:
             logger.error("ReportLab PDF generation failed", error=str(e))
             return False
@@ -168,68 +245,16 @@ class PDFGenerator:
     def _generate_with_html(self, markdown_content: str, output_path: str) -> bool:
         """Generate PDF by converting Markdown to HTML then to PDF."""
         try:
-            import markdown
             from weasyprint import HTML
-            import tempfile
             
             # Convert markdown to HTML
-            html_content = markdown.markdown(markdown_content)
+            html_content = _markdown_to_html(markdown_content)
             
             # Create full HTML document
-            full_html = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <title>Product Requirements Document</title>
-                <style>
-                    body {{
-                        font-family: Arial, sans-serif;
-                        line-height: 1.6;
-                        color: #333;
-                        max-width: 800px;
-                        margin: 0 auto;
-                        padding: 20px;
-                    }}
-                    h1 {{
-                        color: #1E3A8A;
-                        border-bottom: 2px solid #E5E7EB;
-                        padding-bottom: 10px;
-                    }}
-                    h2 {{
-                        color: #374151;
-                        margin-top: 30px;
-                    }}
-                    h3 {{
-                        color: #4B5563;
-                    }}
-                    .footer {{
-                        margin-top: 50px;
-                        padding-top: 20px;
-                        border-top: 1px solid #E5E7EB;
-                        color: #6B7280;
-                        font-size: 0.9em;
-                        text-align: center;
-                    }}
-                    .generation-info {{
-                        color: #6B7280;
-                        font-style: italic;
-                        margin-bottom: 30px;
-                    }}
-                </style>
-            </head>
-            <body>
-                <h1>Product Requirements Document</h1>
-                <div class="generation-info">
-                    Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-                </div>
-                {html_content}
-                <div class="footer">
-                    Generated by AI Product Manager (AutoGen)
-                </div>
-            </body>
-            </html>
-            """
+            full_html = _HTML_SHELL.format_map({
+                "generation_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "html_content": html_content,
+            })
             
             # Generate PDF
             HTML(string=full_html).write_pdf(output_path)
@@ -1,43 +1,120 @@
-import json
+import asyncio
 import os
+import threading
+import time
 import shutil
 from pathlib import Path
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List, Union
+import aiofiles
+import orjson
 import structlog
+from cachetools import TTLCache
+import redis.asyncio as redis
+from redis import Redis as SyncRedis
 from datetime import datetime
+from uuid import uuid4
+from zipstream import ZipStream, ZIP_STORED
 
-from core.models import Run, RunStatus
+from backend.app.core.config import get_settings
+from core.models import Run, RunStatus, Message
 
 logger = structlog.get_logger()
 
+# Per-run append-only log of messages added since run.json was last written
+_MESSAGE_LOG = "messages.jsonl"
+
+# Bytes read per step when scanning the run index backwards
+_INDEX_CHUNK_SIZE = 8192
+
+# Shared run cache in Redis; bump the version prefix to invalidate every entry
+_REDIS_KEY_PREFIX = "v1:run:"
+_REDIS_TTL_SECONDS = 3600
+_REDIS_RETRY_SECONDS = 30
+
+# Bundle entries that are already compressed; DEFLATE on these burns CPU for
+# almost no size reduction
+_STORED_SUFFIXES = frozenset({'.pdf', '.png', '.jpg', '.zip'})
+
+def _write_atomic(path: Path, payload: bytes):
+    """Write a file via a temp file and rename, so readers never see a partial write."""
+    # Unique temp name so concurrent saves of the same run don't share a file
+    tmp_path = path.with_name(f"{path.name}.{uuid4().hex}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
 class StorageService:
     """Service for storing and retrieving runs and their artifacts."""
     
-    def __init__(self, base_data_dir: str = "./data"):
+    def __init__(
+        self,
+        base_data_dir: str = "./data",
+        cache_size: int = 1024,
+        cache_ttl: int = 300,
+        redis_url: Optional[str] = None,
+        bundle_compress_level: int = 1,
+    ):
         self.base_data_dir = Path(base_data_dir)
         self.runs_dir = self.base_data_dir / "runs"
-        self.runs_dir.mkdir(parents=True, exist_ok=True)
+        self.bundle_compress_level = bundle_compress_level
         
-        # In-memory cache of runs
-        self._runs_cache = {}
+        # Bounded in-memory cache of runs; cold runs expire and are reloaded from disk
+        self._runs_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        
+        # Append-only index of (run_id, created_at) in creation order, so
+        # listing reads the tail of one file instead of every run.json; built
+        # on first use, so constructing the service touches no files
+        self._index_path = self.runs_dir / "_index.jsonl"
+        self._index_ready = False
+        self._index_lock = threading.Lock()
+        
+        # Optional Redis cache shared across workers, between the in-process
+        # cache and disk; connected lazily on first use. The sync client only
+        # invalidates entries for the sync mutators
+        self._redis_url = redis_url
+        self._redis = None
+        self._sync_redis = None
+        self._redis_retry_at = 0.0
+    
+    def run_dir(self, run_id: str) -> Path:
+        """Get the directory holding a run's state and artifacts."""
+        return Path(self.runs_dir, run_id)
     
     def create_run(self, idea: str) -> Run:
         """Create a new run with the given idea."""
-        run = Run(idea=idea)
+        # Build a missing index before this run's run.json exists, so the
+        # rebuild doesn't pick it up and the append below add it twice
+        self._ensure_index()
+        run = self._new_run(idea)
         
-        # Create run directory
-        run_dir = self.runs_dir / run.id
-        run_dir.mkdir(parents=True, exist_ok=True)
+        # Save initial run state
+        self._save_run(run)
+        self._runs_cache[run.id] = run
+        with open(self._index_path, 'ab') as f:
+            f.write(self._index_entry(run))
         
-        # Set artifact paths
-        run.set_artifact_path("prd_markdown", str(run_dir / "PRD.md"))
-        run.set_artifact_path("prd_pdf", str(run_dir / "PRD.pdf"))
-        run.set_artifact_path("conversation", str(run_dir / "conversation.json"))
-        run.set_artifact_path("mockup_json", str(run_dir / "mockup.json"))
-        run.set_artifact_path("bundle", str(run_dir / "bundle.zip"))
+        logger.info("Run created", run_id=run.id, idea=idea)
+        return run
+    
+    async def create_run_async(self, idea: str) -> Run:
+        """Create a new run with the given idea without blocking the event loop."""
+        # Build a missing index before this run's run.json exists (see create_run)
+        if not self._index_ready:
+            await asyncio.to_thread(self._ensure_index)
+        run = self._new_run(idea)
         
         # Save initial run state
-        self._save_run(run)
+        await self._save_run_async(run)
+        self._runs_cache[run.id] = run
+        await self._redis_set(run)
+        async with aiofiles.open(self._index_path, 'ab') as f:
+            await f.write(self._index_entry(run))
         
         logger.info("Run created", run_id=run.id, idea=idea)
         return run
@@ -49,50 +126,125 @@ class StorageService:
             return self._runs_cache[run_id]
         
         # Load from disk
-        run_path = self.runs_dir / run_id / "run.json"
+        run_path = self.run_dir(run_id) / "run.json"
         if not run_path.exists():
             return None
         
         try:
-            with open(run_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            run = Run(**data)
+            with open(run_path, 'rb') as f:
+                run = Run.model_validate_json(f.read())
+            log_path = run_path.with_name(_MESSAGE_LOG)
+            if log_path.exists():
+                self._merge_messages(run, log_path.read_bytes())
             self._runs_cache[run_id] = run
             return run
         except Exception as e:
             logger.error("Failed to load run", run_id=run_id, error=str(e))
             return None
     
+    async def get_run_async(self, run_id: str) -> Optional[Run]:
+        """Get a run by ID without blocking the event loop."""
+        # Check cache first
+        if run_id in self._runs_cache:
+            return self._runs_cache[run_id]
+        
+        # Then the shared Redis cache
+        run = await self._redis_get(run_id)
+        if run:
+            self._runs_cache[run_id] = run
+            return run
+        
+        # Load from disk
+        run_path = self.run_dir(run_id) / "run.json"
+        if not run_path.exists():
+            return None
+        
+        try:
+            async with aiofiles.open(run_path, 'rb') as f:
+                run = Run.model_validate_json(await f.read())
+            log_path = run_path.with_name(_MESSAGE_LOG)
+            if await asyncio.to_thread(log_path.exists):
+                async with aiofiles.open(log_path, 'rb') as f:
+                    self._merge_messages(run, await f.read())
+            self._runs_cache[run_id] = run
+            await self._redis_set(run)
+            return run
+        except Exception as e:
+            logger.error("Failed to load run", run_id=run_id, error=str(e))
+            return None
+    
     def update_run(self, run: Run) -> bool:
         """Update a run."""
         try:
             self._save_run(run)
             self._runs_cache[run.id] = run
+            self._redis_delete_sync(run.id)
             return True
         except Exception as e:
             logger.error("Failed to update run", run_id=run.id, error=str(e))
             return False
     
+    async def update_run_async(self, run: Run) -> bool:
+        """Update a run without blocking the event loop."""
+        try:
+            await self._save_run_async(run)
+            self._runs_cache[run.id] = run
+            await self._redis_set(run)
+            return True
+        except Exception as e:
+            logger.error("Failed to update run", run_id=run.id, error=str(e))
+            return False
+    
+    def append_message(self, run_id: str, message: Message) -> bool:
+        """Append a message to a run's log without rewriting run.json."""
+        try:
+            with open(self.run_dir(run_id) / _MESSAGE_LOG, 'ab') as f:
+                f.write(self._message_entry(message))
+            self._runs_cache.pop(run_id, None)
+            self._redis_delete_sync(run_id)
+            return True
+        except Exception as e:
+            logger.error("Failed to append message", run_id=run_id, error=str(e))
+            return False
+    
+    async def append_message_async(self, run_id: str, message: Message) -> bool:
+        """Append a message to a run's log without blocking the event loop."""
+        try:
+            async with aiofiles.open(self.run_dir(run_id) / _MESSAGE_LOG, 'ab') as f:
+                await f.write(self._message_entry(message))
+            self._runs_cache.pop(run_id, None)
+            await self._redis_delete(run_id)
+            return True
+        except Exception as e:
+            logger.error("Failed to append message", run_id=run_id, error=str(e))
+            return False
+    
+    def remove_message_log(self, run_id: str):
+        """Delete a run's message log once run.json holds every message."""
+        try:
+            (self.run_dir(run_id) / _MESSAGE_LOG).unlink(missing_ok=True)
+        except Exception as e:
+            logger.error("Failed to remove message log", run_id=run_id, error=str(e))
+    
+    async def remove_message_log_async(self, run_id: str):
+        """Delete a run's message log without blocking the event loop."""
+        try:
+            await asyncio.to_thread((self.run_dir(run_id) / _MESSAGE_LOG).unlink, missing_ok=True)
+        except Exception as e:
+            logger.error("Failed to remove message log", run_id=run_id, error=str(e))
+    
     def list_runs(self, limit: int = 20, offset: int = 0) -> List[Run]:
         """List runs, sorted by creation date (newest first)."""
-        runs = []
-        
-        # Get all run directories
-        for run_dir in self.runs_dir.iterdir():
-            if not run_dir.is_dir():
-                continue
-            
-            run = self.get_run(run_dir.name)
-            if run:
-                runs.append(run)
-        
-        # Sort by creation date (newest first)
-        runs.sort(key=lambda r: r.created_at, reverse=True)
-        
-        # Apply pagination
-        return runs[offset:offset + limit]
+        run_ids = self._recent_run_ids(offset + limit)[offset:]
+        return [run for run in (self.get_run(run_id) for run_id in run_ids) if run]
+    
+    async def list_runs_async(self, limit: int = 20, offset: int = 0) -> List[Run]:
+        """List runs, sorted by creation date (newest first), without blocking the event loop."""
+        run_ids = (await asyncio.to_thread(self._recent_run_ids, offset + limit))[offset:]
+        runs = await asyncio.gather(*(self.get_run_async(run_id) for run_id in run_ids))
+        return [run for run in runs if run]
     
-    def save_artifact(self, run_id: str, artifact_type: str, content: str) -> bool:
+    def save_artifact(self, run_id: str, artifact_type: str, content: Union[str, bytes, dict]) -> bool:
         """Save an artifact for a run."""
         run = self.get_run(run_id)
         if not run:
@@ -105,15 +257,34 @@ class StorageService:
         try:
             artifact_path.parent.mkdir(parents=True, exist_ok=True)
             
-            if artifact_type == "conversation":
-                # For JSON, parse and pretty-print
-                data = json.loads(content) if isinstance(content, str) else content
-                with open(artifact_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2, default=str)
-            else:
-                # For text/binary, write as-is
-                with open(artifact_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+            with open(artifact_path, 'wb') as f:
+                f.write(self._encode_artifact(artifact_type, content))
+            
+            self._runs_cache.pop(run_id, None)
+            
+            logger.info("Artifact saved", run_id=run_id, artifact_type=artifact_type, path=str(artifact_path))
+            return True
+        except Exception as e:
+            logger.error("Failed to save artifact", run_id=run_id, artifact_type=artifact_type, error=str(e))
+            return False
+    
+    async def save_artifact_async(self, run_id: str, artifact_type: str, content: Union[str, bytes, dict]) -> bool:
+        """Save an artifact for a run without blocking the event loop."""
+        run = await self.get_run_async(run_id)
+        if not run:
+            return False
+        
+        artifact_path = Path(run.get_artifact_path(artifact_type))
+        if not artifact_path:
+            return False
+        
+        try:
+            artifact_path.parent.mkdir(parents=True, exist_ok=True)
+            
+            async with aiofiles.open(artifact_path, 'wb') as f:
+                await f.write(self._encode_artifact(artifact_type, content))
+            
+            self._runs_cache.pop(run_id, None)
             
             logger.info("Artifact saved", run_id=run_id, artifact_type=artifact_type, path=str(artifact_path))
             return True
@@ -127,44 +298,278 @@ class StorageService:
         if not run:
             return None
         
+        return self._write_bundle(run)
+    
+    async def create_bundle_async(self, run_id: str) -> Optional[str]:
+        """Create a zip bundle of all artifacts for a run without blocking the event loop."""
+        run = await self.get_run_async(run_id)
+        if not run:
+            return None
+        
+        # Only the zip is built in the worker thread; the run cache is not
+        # thread-safe, so the run is loaded here on the loop
+        return await asyncio.to_thread(self._write_bundle, run)
+    
+    async def iter_bundle(self, run_id: str) -> AsyncIterator[bytes]:
+        """Stream a zip bundle of all artifacts for a run without writing it to disk."""
+        run = await self.get_run_async(run_id)
+        if not run:
+            return
+        
+        # Artifacts are small (markdown, JSON, PDF), so store them uncompressed
+        # rather than paying for a DEFLATE compressor per entry
+        zs = ZipStream(compress_type=ZIP_STORED)
+        for file_path in self._bundle_files(run):
+            zs.add_path(file_path, arcname=file_path.name)
+        
+        # Pull chunks in a worker thread so file reads don't block the event loop
+        chunks = iter(zs)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+        
+        logger.info("Bundle streamed", run_id=run_id)
+    
+    async def close(self):
+        """Close the Redis connection pools, if any were opened."""
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+        if self._sync_redis is not None:
+            self._sync_redis.close()
+            self._sync_redis = None
+    
+    def _get_redis(self) -> Optional["redis.Redis"]:
+        """Get the Redis client, or None if Redis is disabled or backing off."""
+        if not self._redis_url or time.monotonic() < self._redis_retry_at:
+            return None
+        if self._redis is None:
+            self._redis = redis.from_url(self._redis_url, socket_connect_timeout=1, socket_timeout=1)
+        return self._redis
+    
+    def _redis_failed(self, error: Exception):
+        """Stop using Redis for a while after a failure, falling back to disk."""
+        logger.warning("Redis cache unavailable", error=str(error), retry_in=_REDIS_RETRY_SECONDS)
+        self._redis_retry_at = time.monotonic() + _REDIS_RETRY_SECONDS
+    
+    async def _redis_get(self, run_id: str) -> Optional[Run]:
+        """Get a run from the shared Redis cache."""
+        client = self._get_redis()
+        if client is None:
+            return None
+        
+        try:
+            payload = await client.get(f"{_REDIS_KEY_PREFIX}{run_id}")
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+        
+        if not payload:
+            return None
+        
+        try:
+            return Run.model_validate_json(payload)
+        except Exception as e:
+            # Corrupt or old-schema entry: treat as a miss and drop it, so the
+            # run is reloaded from disk and written back
+            logger.warning("Discarding unreadable cached run", run_id=run_id, error=str(e))
+            await self._redis_delete(run_id)
+            return None
+    
+    async def _redis_set(self, run: Run):
+        """Write a run through to the shared Redis cache."""
+        client = self._get_redis()
+        if client is None:
+            return
+        
+        try:
+            await client.set(f"{_REDIS_KEY_PREFIX}{run.id}", run.model_dump_json(), ex=_REDIS_TTL_SECONDS)
+        except Exception as e:
+            self._redis_failed(e)
+    
+    async def _redis_delete(self, run_id: str):
+        """Drop a run from the shared Redis cache."""
+        client = self._get_redis()
+        if client is None:
+            return
+        
+        try:
+            await client.delete(f"{_REDIS_KEY_PREFIX}{run_id}")
+        except Exception as e:
+            self._redis_failed(e)
+    
+    def _redis_delete_sync(self, run_id: str):
+        """Drop a run from the shared Redis cache from a synchronous caller."""
+        if not self._redis_url or time.monotonic() < self._redis_retry_at:
+            return
+        
+        try:
+            if self._sync_redis is None:
+                self._sync_redis = SyncRedis.from_url(self._redis_url, socket_connect_timeout=1, socket_timeout=1)
+            self._sync_redis.delete(f"{_REDIS_KEY_PREFIX}{run_id}")
+        except Exception as e:
+            self._redis_failed(e)
+    
+    def _write_bundle(self, run: Run) -> Optional[str]:
+        """Write the zip bundle of a loaded run's artifacts."""
         bundle_path = Path(run.get_artifact_path("bundle"))
         if not bundle_path:
             return None
         
+        # Build under a temp name and rename, so a concurrent download never
+        # serves a half-written zip
+        tmp_path = bundle_path.with_name(f"{bundle_path.name}.{uuid4().hex}.tmp")
         try:
-            run_dir = self.runs_dir / run_id
-            
             # Create zip file
             import zipfile
-            with zipfile.ZipFile(bundle_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                # Add all files in run directory
-                for file_path in run_dir.rglob("*"):
-                    if file_path.is_file() and file_path != bundle_path:
-                        arcname = file_path.relative_to(run_dir)
-                        zipf.write(file_path, arcname)
+            with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=self.bundle_compress_level) as zipf:
+                for file_path in self._bundle_files(run):
+                    if file_path.suffix in _STORED_SUFFIXES:
+                        zipf.write(file_path, file_path.name, compress_type=zipfile.ZIP_STORED)
+                    else:
+                        zipf.write(file_path, file_path.name)
+            os.replace(tmp_path, bundle_path)
             
-            logger.info("Bundle created", run_id=run_id, bundle_path=str(bundle_path))
+            logger.info("Bundle created", run_id=run.id, bundle_path=str(bundle_path))
             return str(bundle_path)
         except Exception as e:
-            logger.error("Failed to create bundle", run_id=run_id, error=str(e))
+            tmp_path.unlink(missing_ok=True)
+            logger.error("Failed to create bundle", run_id=run.id, error=str(e))
             return None
     
+    def _bundle_files(self, run: Run) -> List[Path]:
+        """List the files that go into a run's bundle: run.json plus every saved artifact."""
+        paths = [self.run_dir(run.id) / "run.json"]
+        paths.extend(Path(path) for artifact_type, path in run.artifacts.items() if artifact_type != "bundle")
+        return [path for path in paths if path.exists()]
+    
+    def _new_run(self, idea: str) -> Run:
+        """Build a new run and its directory layout."""
+        run = Run(idea=idea)
+        
+        # Create run directory, the only mkdir a run needs; saves write into it
+        run_dir = self.run_dir(run.id)
+        run_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Set artifact paths
+        run.set_artifact_path("prd_markdown", str(run_dir / "PRD.md"))
+        run.set_artifact_path("prd_pdf", str(run_dir / "PRD.pdf"))
+        run.set_artifact_path("conversation", str(run_dir / "conversation.json"))
+        run.set_artifact_path("mockup_json", str(run_dir / "mockup.json"))
+        run.set_artifact_path("bundle", str(run_dir / "bundle.zip"))
+        
+        return run
+    
+    def _message_entry(self, message: Message) -> bytes:
+        """Encode one line of a run's message log."""
+        return message.model_dump_json().encode('utf-8') + b"\n"
+    
+    def _merge_messages(self, run: Run, log: bytes):
+        """Add the logged messages that run.json doesn't hold yet."""
+        known = {message.id for message in run.messages}
+        for line in log.splitlines():
+            if not line.strip():
+                continue
+            try:
+                message = Message.model_validate_json(line)
+            except Exception as e:
+                # A crash mid-append, or a read racing an append, leaves a partial
+                # last line; skip it rather than failing the whole run load
+                logger.warning("Skipping unreadable message log line", run_id=run.id, error=str(e))
+                continue
+            if message.id not in known:
+                run.messages.append(message)
+                run.updated_at = max(run.updated_at, message.timestamp)
+    
+    def _index_entry(self, run: Run) -> bytes:
+        """Encode a run as one line of the run index."""
+        return orjson.dumps({"id": run.id, "ts": run.created_at.timestamp()}) + b"\n"
+    
+    def _ensure_index(self):
+        """Build the run index from the run directories if it doesn't exist yet."""
+        if self._index_ready:
+            return
+        
+        with self._index_lock:
+            if not self._index_ready:
+                if not self._index_path.exists():
+                    self._rebuild_index()
+                self._index_ready = True
+    
+    def _rebuild_index(self):
+        """Rebuild the run index from the run directories on disk."""
+        self.runs_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Read run.json directly rather than through get_run, since this may run
+        # in a worker thread and the run cache is not thread-safe
+        runs = []
+        for run_path in self.runs_dir.glob("*/run.json"):
+            try:
+                runs.append(Run.model_validate_json(run_path.read_bytes()))
+            except Exception as e:
+                logger.error("Failed to load run", run_id=run_path.parent.name, error=str(e))
+        
+        # Oldest first, matching the order entries are appended in
+        runs.sort(key=lambda r: r.created_at)
+        with open(self._index_path, 'wb') as f:
+            f.write(b"".join(self._index_entry(run) for run in runs))
+        
+        logger.info("Run index rebuilt", runs=len(runs))
+    
+    def _recent_run_ids(self, count: int) -> List[str]:
+        """Read the IDs of the newest runs by scanning the index backwards."""
+        if count <= 0:
+            return []
+        
+        self._ensure_index()
+        with open(self._index_path, 'rb') as f:
+            position = f.seek(0, os.SEEK_END)
+            buffer = b""
+            # Read chunks from the end until there are enough complete lines
+            while position > 0 and buffer.count(b"\n") <= count:
+                chunk_size = min(_INDEX_CHUNK_SIZE, position)
+                position -= chunk_size
+                f.seek(position)
+                buffer = f.read(chunk_size) + buffer
+        
+        lines = buffer.splitlines()
+        if position > 0:
+            # First line may have been cut in half by the chunk boundary
+            lines = lines[1:]
+        
+        return [orjson.loads(line)["id"] for line in reversed(lines[-count:]) if line.strip()]
+    
+    def _encode_artifact(self, artifact_type: str, content: Union[str, bytes, dict]) -> bytes:
+        """Encode artifact content to the bytes written to disk."""
+        if artifact_type == "conversation" and not isinstance(content, (str, bytes)):
+            # Serialize structured conversations; serialized ones are written as-is
+            return orjson.dumps(content, option=orjson.OPT_INDENT_2, default=str)
+        
+        # For text/binary, write as-is
+        return content.encode('utf-8') if isinstance(content, str) else content
+    
+    def _serialize_run(self, run: Run) -> bytes:
+        """Serialize a run to JSON bytes."""
+        return run.model_dump_json(indent=2).encode('utf-8')
+    
     def _save_run(self, run: Run):
         """Save run to disk."""
-        run_path = self.runs_dir / run.id / "run.json"
-        run_path.parent.mkdir(parents=True, exist_ok=True)
+        run_path = self.run_dir(run.id) / "run.json"
+        
+        _write_atomic(run_path, self._serialize_run(run))
         
-        # Convert to dict and handle datetime serialization
-        run_dict = run.dict()
-        run_dict["created_at"] = run.created_at.isoformat()
-        run_dict["updated_at"] = run.updated_at.isoformat()
-        if run.completed_at:
-            run_dict["completed_at"] = run.completed_at.isoformat()
+        logger.debug("Run saved", run_id=run.id, path=str(run_path))
+    
+    async def _save_run_async(self, run: Run):
+        """Save run to disk without blocking the event loop."""
+        run_path = self.run_dir(run.id) / "run.json"
         
-        with open(run_path, 'w', encoding='utf-8') as f:
-            json.dump(run_dict, f, indent=2, default=str)
+        # Write, fsync and rename in one worker-thread hop
+        await asyncio.to_thread(_write_atomic, run_path, self._serialize_run(run))
         
         logger.debug("Run saved", run_id=run.id, path=str(run_path))
 
 # Global storage service instance
-storage = StorageService()
+storage = StorageService(redis_url=get_settings().redis_url)
@@ -1,20 +1,140 @@
-"""LLM client for AutoGen integration."""
+"""LLM clients for the agent workflow: OpenAI chat completions or stub responses."""
 
 import asyncio
-import json
+import re
+from urllib.parse import urlparse
 from typing import Dict, List, Optional, Any
+import aiohttp
 import structlog
 from enum import Enum
+from functools import cache, lru_cache
 
-from backend.app.core.config import settings
+from backend.app.core.config import get_settings
 
 logger = structlog.get_logger()
 
+# Pooled aiohttp session shared by every chat completion call, so agent calls
+# reuse keep-alive connections; created lazily on the running event loop
+_session = None
+
+# Stub domains in priority order; the first with a keyword among the prompt's
+# words wins
+_DOMAIN_KEYS = [
+    ("fitness", frozenset({"fitness", "workout", "exercise", "gym"})),
+    ("finance", frozenset({"finance", "budget", "money", "investment", "banking"})),
+    ("meditation", frozenset({"meditation", "mindfulness", "relax", "stress", "mental"})),
+    ("productivity", frozenset({"productivity", "task", "todo", "schedule", "project", "team"})),
+]
+
+_WORD_RE = re.compile(r"[a-z]+")
+
+# Stub placeholder values per domain
+_REPLACEMENTS = {
+    "fitness": {
+        "problem domain": "fitness tracking",
+        "main use case": "workout planning",
+        "item": "workout",
+        "Item": "Workout",
+        "Product": "Fitness Tracker",
+        "Product Name": "Fitness Tracker",
+    },
+    "finance": {
+        "problem domain": "personal finance management",
+        "main use case": "budget tracking",
+        "item": "transaction",
+        "Item": "Transaction",
+        "Product": "Finance Manager",
+        "Product Name": "Finance Manager",
+    },
+    "meditation": {
+        "problem domain": "stress management and mental wellness",
+        "main use case": "meditation practice",
+        "item": "meditation session",
+        "Item": "Meditation Session",
+        "Product": "Mindfulness App",
+        "Product Name": "Mindfulness App",
+    },
+    "productivity": {
+        "problem domain": "task management and productivity",
+        "main use case": "task organization",
+        "item": "task",
+        "Item": "Task",
+        "Product": "Productivity Manager",
+        "Product Name": "Productivity Manager",
+    },
+    "generic": {
+        "problem domain": "the problem domain",
+        "main use case": "the main use case",
+        "item": "item",
+        "Item": "Item",
+        "Product": "Product",
+        "Product Name": "Product Name",
+    },
+}
+
+# Every stub placeholder, so a response is rewritten in a single pass
+_PLACEHOLDER_RE = re.compile(r"\[(problem domain|main use case|item|Item|Product|Product Name)\]")
+
+def _domain_key(prompt: str) -> str:
+    """Classify a prompt into one of the stub domains."""
+    words = set(_WORD_RE.findall(prompt.lower()))
+    # Let plurals ("workouts", "tasks") match their keyword
+    words.update([word[:-1] for word in words if word.endswith("s")])
+    for key, keywords in _DOMAIN_KEYS:
+        if not keywords.isdisjoint(words):
+            return key
+    return "generic"
+
+def _apply_replacements(response: str, domain_key: str) -> str:
+    """Fill the placeholders of a stub response with a domain's values."""
+    replacements = _REPLACEMENTS[domain_key]
+    return _PLACEHOLDER_RE.sub(lambda m: replacements[m.group(1)], response)
+
+@lru_cache(maxsize=64)
+def _rendered_stub(agent_name: str, domain_key: str) -> str:
+    """Get an agent's stub response rendered for a domain, computed once per pair."""
+    # Import here to avoid circular imports
+    from core.prompts import get_stub_response
+    
+    return _apply_replacements(get_stub_response(agent_name), domain_key)
+
+def _get_session():
+    """Get the shared aiohttp session, creating it on first use."""
+    global _session
+    
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=120)
+        )
+    return _session
+
+async def close_http_session():
+    """Close the shared aiohttp session, if one was opened."""
+    global _session
+    
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+async def _openai_aiohttp_call(messages: List[Dict[str, str]], model: str, **params: Any) -> str:
+    """Call the OpenAI chat completions endpoint and return the reply content."""
+    settings = get_settings()
+    
+    async with _get_session().post(
+        f"{settings.openai_base_url.rstrip('/')}/chat/completions",
+        headers={"Authorization": f"Bearer {settings.openai_api_key}"},
+        json={"model": model, "messages": messages, **params},
+    ) as response:
+        response.raise_for_status()
+        data = await response.json()
+    
+    return data["choices"][0]["message"]["content"] or ""
+
 class LLMType(str, Enum):
     """Type of LLM to use."""
     STUB = "stub"
     OPENAI = "openai"
-    AUTOGEN = "autogen"
 
 class LLMClient:
     """Base LLM client interface."""
@@ -26,234 +146,101 @@ class LLMClient:
     async def generate(self, prompt: str, agent_name: str, **kwargs) -> str:
         """Generate a response."""
         raise NotImplementedError
+    
+    async def warmup(self):
+        """Prepare the client ahead of the first generate() call."""
+        pass
 
 class StubLLMClient(LLMClient):
     """Stub LLM client for testing without real API calls."""
     
-    def __init__(self, seed: int = 42):
+    def __init__(self, seed: int = 42, latency: Optional[float] = None):
         super().__init__(LLMType.STUB, seed)
+        self.latency = get_settings().stub_latency_seconds if latency is None else latency
     
     async def generate(self, prompt: str, agent_name: str, **kwargs) -> str:
         """Generate a response using stub data."""
         logger.debug("Stub LLM generating response", agent_name=agent_name, prompt_length=len(prompt))
         
-        # Simulate processing time
-        await asyncio.sleep(0.5)
-        
-        # Import here to avoid circular imports
-        from core.prompts import get_stub_response
+        # Simulate processing time, if configured
+        if self.latency:
+            await asyncio.sleep(self.latency)
         
-        # Return stub response based on agent
-        response = get_stub_response(agent_name)
-        
-        # Apply keyword replacement
-        return self._apply_keyword_replacement(response, prompt)
-    
-    def _apply_keyword_replacement(self, response: str, prompt: str) -> str:
-        """Apply keyword replacement to stub response based on prompt content."""
-        # Check for fitness-related keywords
-        if any(keyword in prompt.lower() for keyword in ["fitness", "workout", "exercise", "gym"]):
-            response = response.replace("[problem domain]", "fitness tracking")
-            response = response.replace("[main use case]", "workout planning")
-            response = response.replace("[item]", "workout")
-            response = response.replace("[Item]", "Workout")
-            response = response.replace("[Product]", "Fitness Tracker")
-            response = response.replace("[Product Name]", "Fitness Tracker")
-        # Check for finance-related keywords
-        elif any(keyword in prompt.lower() for keyword in ["finance", "budget", "money", "investment", "banking"]):
-            response = response.replace("[problem domain]", "personal finance management")
-            response = response.replace("[main use case]", "budget tracking")
-            response = response.replace("[item]", "transaction")
-            response = response.replace("[Item]", "Transaction")
-            response = response.replace("[Product]", "Finance Manager")
-            response = response.replace("[Product Name]", "Finance Manager")
-        # Check for meditation-related keywords
-        elif any(keyword in prompt.lower() for keyword in ["meditation", "mindfulness", "relax", "stress", "mental"]):
-            response = response.replace("[problem domain]", "stress management and mental wellness")
-            response = response.replace("[main use case]", "meditation practice")
-            response = response.replace("[item]", "meditation session")
-            response = response.replace("[Item]", "Meditation Session")
-            response = response.replace("[Product]", "Mindfulness App")
-            response = response.replace("[Product Name]", "Mindfulness App")
-        # Check for productivity-related keywords
-        elif any(keyword in prompt.lower() for keyword in ["productivity", "task", "todo", "schedule", "project", "team"]):
-            response = response.replace("[problem domain]", "task management and productivity")
-            response = response.replace("[main use case]", "task organization")
-            response = response.replace("[item]", "task")
-            response = response.replace("[Item]", "Task")
-            response = response.replace("[Product]", "Productivity Manager")
-            response = response.replace("[Product Name]", "Productivity Manager")
-        # Default generic replacement
-        else:
-            response = response.replace("[problem domain]", "the problem domain")
-            response = response.replace("[main use case]", "the main use case")
-            response = response.replace("[item]", "item")
-            response = response.replace("[Item]", "Item")
-            response = response.replace("[Product]", "Product")
-            response = response.replace("[Product Name]", "Product Name")
-        
-        return response
+        # Return stub response based on agent, with keyword replacement applied
+        return _rendered_stub(agent_name, _domain_key(prompt))
 
-class AutoGenLLMClient(LLMClient):
-    """AutoGen LLM client for real OpenAI API calls."""
+class OpenAILLMClient(LLMClient):
+    """LLM client for real OpenAI API calls."""
     
     def __init__(self, seed: int = 42):
         super().__init__(LLMType.OPENAI, seed)
-        self._client = None
-        self._config_list = None
-        
-        # Check if AutoGen is available
-        try:
-            import autogen
-            self._autogen_available = True
-        except ImportError:
-            self._autogen_available = False
-            raise ImportError(
-                "AutoGen is not installed. Install with: pip install pyautogen"
-            )
+        settings = get_settings()
+        self.model = settings.openai_model
+        # OpenAI-compatible endpoints may reject unknown parameters, so only
+        # send the prompt cache key where it is known to be supported
+        self.send_cache_key = settings.openai_prompt_cache_key
+        if self.send_cache_key is None:
+            self.send_cache_key = urlparse(settings.openai_base_url).hostname == "api.openai.com"
+        self._warmed_up = False
+        self._warmup_lock = asyncio.Lock()
     
-    def _initialize_autogen(self):
-        """Initialize AutoGen client."""
-        if not self._autogen_available:
-            raise ImportError("AutoGen is not available")
-        
-        import autogen
-        
-        # Create config list for OpenAI
-        self._config_list = [
-            {
-                "model": settings.openai_model,
-                "api_key": settings.openai_api_key,
-                "base_url": settings.openai_base_url,
-            }
-        ]
-        
-        # Configure LLM
-        llm_config = {
-            "config_list": self._config_list,
-            "seed": self.seed,
-            "temperature": 0.7,
-            "timeout": 120,
-        }
-        
-        return autogen.AssistantAgent, autogen.UserProxyAgent, llm_config
+    async def warmup(self):
+        """Open a pooled connection to the API so the first agent call skips the handshake."""
+        async with self._warmup_lock:
+            if self._warmed_up:
+                return
+            
+            settings = get_settings()
+            try:
+                async with _get_session().get(
+                    f"{settings.openai_base_url.rstrip('/')}/models",
+                    headers={"Authorization": f"Bearer {settings.openai_api_key}"},
+                ) as response:
+                    await response.read()
+                self._warmed_up = True
+                logger.info("LLM client warmed up")
+            except Exception as e:
+                logger.warning("LLM client warmup failed", error=str(e))
     
     async def generate(self, prompt: str, agent_name: str, **kwargs) -> str:
-        """Generate a response using AutoGen with OpenAI."""
-        logger.debug("AutoGen LLM generating response", agent_name=agent_name, prompt_length=len(prompt))
+        """Generate a response with a single chat completion call."""
+        logger.debug("OpenAI LLM generating response", agent_name=agent_name, prompt_length=len(prompt))
         
         try:
-            # Initialize AutoGen
-            AssistantAgent, UserProxyAgent, llm_config = self._initialize_autogen()
-            
-            # Create agent based on role
-            agent_config = {
-                "name": agent_name,
-                "system_message": f"You are a {agent_name}. {prompt}",
-                "llm_config": llm_config,
-            }
-            
-            agent = AssistantAgent(**agent_config)
-            
-            # Create user proxy agent
-            user_proxy = UserProxyAgent(
-                name="user_proxy",
-                human_input_mode="NEVER",
-                max_consecutive_auto_reply=1,
-                code_execution_config=False,
-            )
-            
-            # Start conversation
-            user_proxy.initiate_chat(
-                agent,
-                message="Please provide your analysis based on your role and the system message.",
-                clear_history=True,
-            )
-            
-            # Get the last message from the agent
-            if agent.chat_messages and user_proxy.name in agent.chat_messages:
-                messages = agent.chat_messages[user_proxy.name]
-                if messages:
-                    # Return the last message content
-                    return messages[-1]["content"]
+            # Send the prompt as-is so its shared run context stays the leading,
+            # cacheable part of the request; the cache key routes every step of
+            # a run to the same prompt cache
+            messages = [{"role": "user", "content": prompt}]
+            params = {"seed": self.seed, "temperature": 0.7}
+            if self.send_cache_key and kwargs.get("cache_key"):
+                params["prompt_cache_key"] = kwargs["cache_key"]
+            response = await _openai_aiohttp_call(messages, self.model, **params)
+            if response:
+                return response
             
             # If we get here, fall back to stub
-            logger.warning("AutoGen agent returned no response, falling back to stub")
-            from core.prompts import get_stub_response
-            response = get_stub_response(agent_name)
-            # Apply keyword replacement like StubLLMClient does
-            return self._apply_keyword_replacement(response, prompt)
+            logger.warning("OpenAI returned no response, falling back to stub")
+            return _rendered_stub(agent_name, _domain_key(prompt))
             
         except Exception as e:
-            logger.error("AutoGen LLM generation failed, falling back to stub", agent_name=agent_name, error=str(e))
+            logger.error("OpenAI LLM generation failed, falling back to stub", agent_name=agent_name, error=str(e))
             # Fall back to stub response
-            from core.prompts import get_stub_response
-            response = get_stub_response(agent_name)
-            # Apply keyword replacement like StubLLMClient does
-            return self._apply_keyword_replacement(response, prompt)
-    
-    def _apply_keyword_replacement(self, response: str, prompt: str) -> str:
-        """Apply keyword replacement to stub response based on prompt content."""
-        # Check for fitness-related keywords
-        if any(keyword in prompt.lower() for keyword in ["fitness", "workout", "exercise", "gym"]):
-            response = response.replace("[problem domain]", "fitness tracking")
-            response = response.replace("[main use case]", "workout planning")
-            response = response.replace("[item]", "workout")
-            response = response.replace("[Item]", "Workout")
-            response = response.replace("[Product]", "Fitness Tracker")
-            response = response.replace("[Product Name]", "Fitness Tracker")
-        # Check for finance-related keywords
-        elif any(keyword in prompt.lower() for keyword in ["finance", "budget", "money", "investment", "banking"]):
-            response = response.replace("[problem domain]", "personal finance management")
-            response = response.replace("[main use case]", "budget tracking")
-            response = response.replace("[item]", "transaction")
-            response = response.replace("[Item]", "Transaction")
-            response = response.replace("[Product]", "Finance Manager")
-            response = response.replace("[Product Name]", "Finance Manager")
-        # Check for meditation-related keywords
-        elif any(keyword in prompt.lower() for keyword in ["meditation", "mindfulness", "relax", "stress", "mental"]):
-            response = response.replace("[problem domain]", "stress management and mental wellness")
-            response = response.replace("[main use case]", "meditation practice")
-            response = response.replace("[item]", "meditation session")
-            response = response.replace("[Item]", "Meditation Session")
-            response = response.replace("[Product]", "Mindfulness App")
-            response = response.replace("[Product Name]", "Mindfulness App")
-        # Check for productivity-related keywords
-        elif any(keyword in prompt.lower() for keyword in ["productivity", "task", "todo", "schedule", "project", "team"]):
-            response = response.replace("[problem domain]", "task management and productivity")
-            response = response.replace("[main use case]", "task organization")
-            response = response.replace("[item]", "task")
-            response = response.replace("[Item]", "Task")
-            response = response.replace("[Product]", "Productivity Manager")
-            response = response.replace("[Product Name]", "Productivity Manager")
-        # Default generic replacement
-        else:
-            response = response.replace("[problem domain]", "the problem domain")
-            response = response.replace("[main use case]", "the main use case")
-            response = response.replace("[item]", "item")
-            response = response.replace("[Item]", "Item")
-            response = response.replace("[Product]", "Product")
-            response = response.replace("[Product Name]", "Product Name")
-        
-        return response
+            return _rendered_stub(agent_name, _domain_key(prompt))
 
+@cache
 def get_llm_client() -> LLMClient:
-    """Get appropriate LLM client based on configuration."""
+    """Get appropriate LLM client based on configuration, created on first use."""
+    settings = get_settings()
+    
     # Check if OpenAI API key is provided
     if settings.openai_api_key and settings.openai_api_key != "your_openai_api_key_here":
         try:
-            # Try to create AutoGen client
-            client = AutoGenLLMClient(seed=settings.agent_seed)
-            logger.info("Using AutoGen LLM client with OpenAI")
+            client = OpenAILLMClient(seed=settings.agent_seed)
+            logger.info("Using OpenAI LLM client")
             return client
-        except ImportError:
-            logger.warning("AutoGen not installed, falling back to stub LLM")
         except Exception as e:
-            logger.warning(f"Failed to initialize AutoGen: {e}, falling back to stub LLM")
+            logger.warning(f"Failed to initialize OpenAI client: {e}, falling back to stub LLM")
     
     # Fall back to stub
-    logger.info("Using stub LLM client (no OpenAI API key or AutoGen unavailable)")
+    logger.info("Using stub LLM client (no OpenAI API key)")
     return StubLLMClient(seed=settings.agent_seed)
-
-# Global LLM client instance
-llm_client = get_llm_client()
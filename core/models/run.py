@@ -1,8 +1,13 @@
+import os
+import orjson
 from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from enum import Enum
-from uuid import uuid4
+
+def _new_id() -> str:
+    """Generate a random 128-bit ID as 32 hex characters."""
+    return os.urandom(16).hex()
 
 class RunStatus(str, Enum):
     """Status of a run."""
@@ -23,7 +28,7 @@ class AgentRole(str, Enum):
 
 class Message(BaseModel):
     """A message in the conversation."""
-    id: str = Field(default_factory=lambda: str(uuid4()))
+    id: str = Field(default_factory=_new_id)
     role: AgentRole
     content: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
@@ -32,7 +37,7 @@ class Message(BaseModel):
 
 class Run(BaseModel):
     """A run representing a product idea through the agent workflow."""
-    id: str = Field(default_factory=lambda: str(uuid4()))
+    id: str = Field(default_factory=_new_id)
     idea: str
     status: RunStatus = RunStatus.PENDING
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -56,7 +61,8 @@ class Run(BaseModel):
     
     def add_message(self, role: AgentRole, content: str, step: int = 0, metadata: Optional[Dict] = None) -> Message:
         """Add a message to the conversation."""
-        message = Message(
+        # Fields come from the orchestrator, not user input, so skip validation
+        message = Message.model_construct(
             role=role,
             content=content,
             step=step,
@@ -66,6 +72,13 @@ class Run(BaseModel):
         self.updated_at = datetime.utcnow()
         return message
     
+    @property
+    def user_answers_json(self) -> str:
+        """User answers serialized as JSON."""
+        # Computed on each access: user_answers is a public, mutable field, and
+        # the workflow reads this once per run, so a cache could only go stale
+        return orjson.dumps(self.user_answers).decode()
+    
     def update_status(self, status: RunStatus):
         """Update the run status."""
         self.status = status
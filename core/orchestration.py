@@ -1,38 +1,55 @@
 """Agent orchestration for the AI Product Manager."""
 
 import asyncio
-import json
-from typing import Dict, List, Optional, Any
+import orjson
+from typing import Dict, List, Optional, Any, Set
 import structlog
 from datetime import datetime
 
 from core.models import Run, RunStatus, AgentRole, Message
-from core.prompts import get_agent_prompt, get_prd_template
+from core.prompts import get_agent_prompt, get_context_prefix, get_prd_template
 from core.llm_client import get_llm_client, LLMClient
-from backend.services import storage, pdf_generator
-from backend.app.core.config import settings
+from backend.services import storage, pdf_generator, run_cpu_bound
+from backend.app.core.config import get_settings
 
 logger = structlog.get_logger()
 
+# Conversation history header label for each role
+_ROLE_UPPER = {role: role.value.upper() for role in AgentRole}
+
 class Orchestrator:
     """Orchestrates the 4-agent workflow."""
     
     def __init__(self, llm_client: Optional[LLMClient] = None):
-        self.llm_client = llm_client or get_llm_client()
+        self._llm_client = llm_client
         self.storage = storage
+        
+        # In-flight background writes per run, drained before the run's final write
+        self._pending: Dict[str, Set[asyncio.Task]] = {}
+    
+    @property
+    def llm_client(self) -> LLMClient:
+        """LLM client, resolved from configuration on first use unless one was injected."""
+        if self._llm_client is None:
+            self._llm_client = get_llm_client()
+        return self._llm_client
+    
+    async def warmup(self):
+        """Resolve the LLM client and warm up its connection before the first run."""
+        await self.llm_client.warmup()
     
     async def run_agents(self, run_id: str) -> Run:
         """Run the 5-agent workflow for a given run."""
         logger.info("Starting agent workflow", run_id=run_id)
         
         # Get the run
-        run = self.storage.get_run(run_id)
+        run = await self.storage.get_run_async(run_id)
         if not run:
             raise ValueError(f"Run not found: {run_id}")
         
         # Update status to running
         run.update_status(RunStatus.RUNNING)
-        self.storage.update_run(run)
+        await self.storage.update_run_async(run)
         
         try:
             # Step 1: Strategist
@@ -50,12 +67,14 @@ class Orchestrator:
             # Step 5: PRD Synthesizer
             await self._run_synthesizer(run)
             
-            # Update status to completed
+            # Finish the background writes (including the PDF) while saving the
+            # conversation, then record completion once every artifact exists
             run.update_status(RunStatus.COMPLETED)
-            self.storage.update_run(run)
-            
-            # Save conversation as artifact
-            self._save_conversation_artifact(run)
+            await asyncio.gather(
+                self._drain(run),
+                self._save_conversation_artifact(run)
+            )
+            await self._save_final_state(run)
             
             logger.info("Agent workflow completed", run_id=run_id)
             return run
@@ -63,7 +82,8 @@ class Orchestrator:
         except Exception as e:
             logger.error("Agent workflow failed", run_id=run_id, error=str(e))
             run.update_status(RunStatus.FAILED)
-            self.storage.update_run(run)
+            await self._drain(run)
+            await self._save_final_state(run)
             raise
     
     async def _run_strategist(self, run: Run):
@@ -71,110 +91,84 @@ class Orchestrator:
         logger.debug("Running strategist agent", run_id=run.id)
         
         # Create prompt
-        prompt = get_agent_prompt(
+        prompt = self._build_prompt(
+            run,
             "strategist",
-            idea=run.idea,
-            max_questions=settings.max_strategist_questions
+            max_questions=get_settings().max_strategist_questions
         )
         
         # Generate response
-        response = await self.llm_client.generate(prompt, "strategist")
+        response = await self.llm_client.generate(prompt, "strategist", cache_key=run.id)
         
         # Add message to conversation
-        run.add_message(
+        message = run.add_message(
             role=AgentRole.STRATEGIST,
             content=response,
             step=1,
             metadata={"agent": "strategist", "prompt_length": len(prompt)}
         )
         
-        # Update run
-        self.storage.update_run(run)
+        # Log the message; run.json itself is rewritten only when the run ends
+        await self.storage.append_message_async(run.id, message)
     
     async def _run_architect(self, run: Run):
         """Run the architect agent."""
         logger.debug("Running architect agent", run_id=run.id)
         
-        # Get strategist's analysis (last strategist message)
-        strategist_messages = [m for m in run.messages if m.role == AgentRole.STRATEGIST]
-        strategist_analysis = strategist_messages[-1].content if strategist_messages else ""
-        
         # Create prompt
-        prompt = get_agent_prompt(
+        prompt = self._build_prompt(
+            run,
             "architect",
-            idea=run.idea,
-            strategist_analysis=strategist_analysis,
-            user_answers=json.dumps(run.user_answers)
+            user_answers=run.user_answers_json
         )
         
         # Generate response
-        response = await self.llm_client.generate(prompt, "architect")
+        response = await self.llm_client.generate(prompt, "architect", cache_key=run.id)
         
         # Add message to conversation
-        run.add_message(
+        message = run.add_message(
             role=AgentRole.ARCHITECT,
             content=response,
             step=2,
             metadata={"agent": "architect", "prompt_length": len(prompt)}
         )
         
-        # Update run
-        self.storage.update_run(run)
+        # Log the message; run.json itself is rewritten only when the run ends
+        await self.storage.append_message_async(run.id, message)
     
     async def _run_ux_writer(self, run: Run):
         """Run the UX writer agent."""
         logger.debug("Running UX writer agent", run_id=run.id)
         
-        # Get architect's analysis (last architect message)
-        architect_messages = [m for m in run.messages if m.role == AgentRole.ARCHITECT]
-        architect_analysis = architect_messages[-1].content if architect_messages else ""
-        
         # Create prompt
-        prompt = get_agent_prompt(
-            "ux_writer",
-            idea=run.idea,
-            architect_analysis=architect_analysis
-        )
+        prompt = self._build_prompt(run, "ux_writer")
         
         # Generate response
-        response = await self.llm_client.generate(prompt, "ux_writer")
+        response = await self.llm_client.generate(prompt, "ux_writer", cache_key=run.id)
         
         # Add message to conversation
-        run.add_message(
+        message = run.add_message(
             role=AgentRole.UX_WRITER,
             content=response,
             step=3,
             metadata={"agent": "ux_writer", "prompt_length": len(prompt)}
         )
         
-        # Update run
-        self.storage.update_run(run)
+        # Log the message; run.json itself is rewritten only when the run ends
+        await self.storage.append_message_async(run.id, message)
     
     async def _run_mockup_designer(self, run: Run):
         """Run the mockup designer agent."""
         logger.debug("Running mockup designer agent", run_id=run.id)
         
-        # Get UX writer's analysis (last UX writer message)
-        ux_writer_messages = [m for m in run.messages if m.role == AgentRole.UX_WRITER]
-        ux_writer_analysis = ux_writer_messages[-1].content if ux_writer_messages else ""
-        
-        # Get architect's analysis (last architect message)
-        architect_messages = [m for m in run.messages if m.role == AgentRole.ARCHITECT]
-        architect_analysis = architect_messages[-1].content if architect_messages else ""
-        
         # Create prompt
-        prompt = get_agent_prompt(
-            "mockup_designer",
-            idea=run.idea,
-            architect_analysis=architect_analysis,
-            ux_writer_analysis=ux_writer_analysis
-        )
+        prompt = self._build_prompt(run, "mockup_designer")
         
         # Generate response
-        response = await self.llm_client.generate(prompt, "mockup_designer")
+        response = await self.llm_client.generate(prompt, "mockup_designer", cache_key=run.id)
         
         # Add message to conversation
-        run.add_message(
+        message = run.add_message(
             role=AgentRole.MOCKUP_DESIGNER,
             content=response,
             step=4,
@@ -182,40 +176,30 @@ class Orchestrator:
         )
         
         # Save mockup.json as artifact
-        try:
-            # Try to parse as JSON to validate
-            mockup_data = json.loads(response)
-            self.storage.save_artifact(run.id, "mockup_json", json.dumps(mockup_data, indent=2))
-        except json.JSONDecodeError:
-            # If not valid JSON, save as text
-            logger.warning("Mockup designer response is not valid JSON, saving as text", run_id=run.id)
-            self.storage.save_artifact(run.id, "mockup_json", response)
+        self._in_background(run, self._save_mockup_artifact(run, response))
         
-        # Update run
-        self.storage.update_run(run)
+        # Log the message; run.json itself is rewritten only when the run ends
+        await self.storage.append_message_async(run.id, message)
     
     async def _run_synthesizer(self, run: Run):
         """Run the PRD synthesizer agent."""
         logger.debug("Running PRD synthesizer agent", run_id=run.id)
         
-        # Build conversation history
-        conversation_history = self._format_conversation_history(run)
-        
         # Get PRD template
         prd_template = get_prd_template()
         
         # Create prompt
-        prompt = get_agent_prompt(
+        prompt = self._build_prompt(
+            run,
             "synthesizer",
-            conversation_history=conversation_history,
             prd_template=prd_template
         )
         
         # Generate response
-        response = await self.llm_client.generate(prompt, "synthesizer")
+        response = await self.llm_client.generate(prompt, "synthesizer", cache_key=run.id)
         
         # Add message to conversation
-        run.add_message(
+        message = run.add_message(
             role=AgentRole.SYNTHESIZER,
             content=response,
             step=5,
@@ -223,30 +207,33 @@ class Orchestrator:
         )
         
         # Save PRD as artifact
-        self.storage.save_artifact(run.id, "prd_markdown", response)
+        await self.storage.save_artifact_async(run.id, "prd_markdown", response)
         
         # Generate PDF from PRD
-        self._generate_pdf(run, response)
+        self._in_background(run, self._generate_pdf(run, response))
         
-        # Update run
-        self.storage.update_run(run)
+        # Log the message; run.json itself is rewritten only when the run ends
+        await self.storage.append_message_async(run.id, message)
+    
+    def _build_prompt(self, run: Run, agent_name: str, **kwargs) -> str:
+        """Build an agent prompt: the shared run context first, then the agent's instructions."""
+        prefix = get_context_prefix(run.idea, self._format_conversation_history(run))
+        return prefix + get_agent_prompt(agent_name, **kwargs)
     
     def _format_conversation_history(self, run: Run) -> str:
-        """Format conversation history for the synthesizer."""
-        lines = []
-        for i, message in enumerate(run.messages):
-            lines.append(f"=== {message.role.value.upper()} (Step {message.step}) ===")
-            lines.append(message.content)
-            lines.append("")  # Empty line between messages
-        
-        return "\n".join(lines)
+        """Format conversation history for agent prompts."""
+        # Empty line between messages
+        return "\n".join(
+            f"=== {_ROLE_UPPER[message.role]} (Step {message.step}) ===\n{message.content}\n"
+            for message in run.messages
+        )
     
-    def _generate_pdf(self, run: Run, prd_content: str):
-        """Generate PDF from PRD content."""
+    async def _generate_pdf(self, run: Run, prd_content: str):
+        """Generate PDF from PRD content in the CPU pool."""
         try:
             pdf_path = run.get_artifact_path("prd_pdf")
             if pdf_path:
-                success = pdf_generator.generate_from_markdown(prd_content, pdf_path)
+                success = await run_cpu_bound(pdf_generator.generate_from_markdown, prd_content, pdf_path)
                 if success:
                     logger.info("PDF generated successfully", run_id=run.id, pdf_path=pdf_path)
                 else:
@@ -254,34 +241,39 @@ class Orchestrator:
         except Exception as e:
             logger.error("Failed to generate PDF", run_id=run.id, error=str(e))
     
-    def _save_conversation_artifact(self, run: Run):
+    async def _save_mockup_artifact(self, run: Run, response: str):
+        """Save the mockup designer's response as mockup.json."""
+        try:
+            # Try to parse as JSON to validate
+            mockup_data = orjson.loads(response)
+            await self.storage.save_artifact_async(run.id, "mockup_json", orjson.dumps(mockup_data, option=orjson.OPT_INDENT_2))
+        except orjson.JSONDecodeError:
+            # If not valid JSON, save as text
+            logger.warning("Mockup designer response is not valid JSON, saving as text", run_id=run.id)
+            await self.storage.save_artifact_async(run.id, "mockup_json", response)
+    
+    def _in_background(self, run: Run, coro):
+        """Start a write for a run without waiting for it."""
+        task = asyncio.create_task(coro)
+        self._pending.setdefault(run.id, set()).add(task)
+    
+    async def _save_final_state(self, run: Run):
+        """Write the finished run, then drop its message log, which run.json now covers."""
+        if await self.storage.update_run_async(run):
+            await self.storage.remove_message_log_async(run.id)
+    
+    async def _drain(self, run: Run):
+        """Wait for a run's background writes to finish."""
+        tasks = self._pending.pop(run.id, set())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _save_conversation_artifact(self, run: Run):
         """Save conversation as JSON artifact."""
-        conversation_data = {
-            "run_id": run.id,
-            "idea": run.idea,
-            "status": run.status.value,
-            "created_at": run.created_at.isoformat(),
-            "completed_at": run.completed_at.isoformat() if run.completed_at else None,
-            "messages": [
-                {
-                    "id": msg.id,
-                    "role": msg.role.value,
-                    "content": msg.content,
-                    "timestamp": msg.timestamp.isoformat(),
-                    "step": msg.step,
-                    "metadata": msg.metadata
-                }
-                for msg in run.messages
-            ],
-            "user_answers": run.user_answers,
-            "assumptions": run.assumptions,
-            "artifacts": run.artifacts
-        }
-        
-        self.storage.save_artifact(
+        await self.storage.save_artifact_async(
             run.id,
             "conversation",
-            json.dumps(conversation_data, indent=2)
+            run.model_dump_json(indent=2)
         )
 
 # Global orchestrator instance
@@ -2,6 +2,7 @@
 from .templates import (
     get_prd_template,
     get_agent_prompt,
+    get_context_prefix,
     get_stub_response,
     PRD_TEMPLATE,
     STRATEGIST_PROMPT,
@@ -13,6 +14,7 @@ from .templates import (
 __all__ = [
     "get_prd_template",
     "get_agent_prompt",
+    "get_context_prefix",
     "get_stub_response",
     "PRD_TEMPLATE",
     "STRATEGIST_PROMPT",
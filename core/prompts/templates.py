@@ -57,6 +57,17 @@ PRD_TEMPLATE = """# {product_name} - Product Requirements Document
 *Run ID: {run_id}*"""
 
 # Agent prompts with expert personas
+# Shared context at the head of every agent prompt. It only grows between
+# steps, so each prompt starts with the previous one's prefix and providers
+# can reuse their prompt cache for it
+CONTEXT_PREFIX = """Product idea: {idea}
+
+Conversation so far:
+{conversation_history}
+---
+
+"""
+
 STRATEGIST_PROMPT = """You are Alex Sterling, an ex-McKinsey Product Strategist with 15+ years experience at FAANG companies. 
 You're known for your razor-sharp business acumen and ability to uncover hidden market opportunities.
 
@@ -71,8 +82,6 @@ PERSONALITY: Analytical, direct, always asks the tough questions. You speak with
 
 YOUR ROLE: Analyze the product idea through multiple strategic lenses to uncover the core business value, target market, and success metrics.
 
-Product idea: {idea}
-
 Using your expertise, ask up to {max_questions} strategic clarifying questions that would uncover:
 1. The core problem being solved and its market size
 2. Target user personas with demographic and psychographic profiles
@@ -111,8 +120,6 @@ PERSONALITY: Methodical, detail-oriented, pragmatic. You balance theoretical per
 
 YOUR ROLE: Translate the strategic vision into a robust, scalable technical architecture that balances innovation with practicality.
 
-Product idea: {idea}
-Strategist analysis: {strategist_analysis}
 User answers: {user_answers}
 
 Using your expertise, provide a comprehensive architecture plan that includes:
@@ -164,9 +171,6 @@ PERSONALITY: Empathetic, creative, meticulous. You understand that words shape e
 
 YOUR ROLE: Transform technical requirements into intuitive user experiences through thoughtful information architecture and human-centered microcopy.
 
-Product idea: {idea}
-Architect analysis: {architect_analysis}
-
 Using your expertise, provide a comprehensive UX design plan that includes:
 
 **UX Analysis by Jordan Rivera**
@@ -251,10 +255,6 @@ PERSONALITY: Creative, systematic, user-obsessed. You believe beautiful design s
 
 YOUR ROLE: Transform UX requirements into tangible, interactive wireframes that visualize the product experience and provide clear guidance for development.
 
-Product idea: {idea}
-Architect analysis: {architect_analysis}
-UX Writer analysis: {ux_writer_analysis}
-
 Using your expertise, create a comprehensive mockup specification that includes:
 
 **Design Analysis by Sofia Rossi**
@@ -388,15 +388,12 @@ PERSONALITY: Scholarly, precise, synthesizing. You excel at finding the signal i
 
 YOUR ROLE: Synthesize the expert analyses from your colleagues into a comprehensive, actionable Product Requirements Document that will guide the engineering team to successful implementation.
 
-You have access to the entire conversation with expert analyses from:
+You have access to the entire conversation above, with expert analyses from:
 1. **Alex Sterling** (Strategist) - Business strategy and market analysis
 2. **Dr. Maya Chen** (Architect) - Technical architecture and implementation plan
 3. **Jordan Rivera** (UX Writer) - User experience and interface design
 4. **Sofia Rossi** (Mockup Designer) - Visual design and interaction specifications
 
-Conversation history:
-{conversation_history}
-
 Using your expertise, compile a complete PRD using the following template structure. For each section:
 - Synthesize inputs from relevant experts
 - Cite specific decisions and analyses from the conversation
@@ -706,30 +703,36 @@ def get_prd_template() -> str:
     """Get the PRD template."""
     return PRD_TEMPLATE
 
+def get_context_prefix(idea: str, conversation_history: str) -> str:
+    """Get the shared context prefix for agent prompts."""
+    return CONTEXT_PREFIX.format_map({"idea": idea, "conversation_history": conversation_history})
+
+# Agent prompt templates by agent name
+_PROMPTS = {
+    "strategist": STRATEGIST_PROMPT,
+    "architect": ARCHITECT_PROMPT,
+    "ux_writer": UX_WRITER_PROMPT,
+    "mockup_designer": MOCKUP_DESIGNER_PROMPT,
+    "synthesizer": SYNTHESIZER_PROMPT,
+}
+
 def get_agent_prompt(agent_name: str, **kwargs) -> str:
     """Get prompt for a specific agent."""
-    prompts = {
-        "strategist": STRATEGIST_PROMPT,
-        "architect": ARCHITECT_PROMPT,
-        "ux_writer": UX_WRITER_PROMPT,
-        "mockup_designer": MOCKUP_DESIGNER_PROMPT,
-        "synthesizer": SYNTHESIZER_PROMPT,
-    }
-    
-    prompt = prompts.get(agent_name.lower())
+    prompt = _PROMPTS.get(agent_name.lower())
     if not prompt:
         raise ValueError(f"Unknown agent: {agent_name}")
     
-    return prompt.format(**kwargs)
+    return prompt.format_map(kwargs)
+
+# Stub responses by agent name
+_STUB_RESPONSES = {
+    "strategist": STUB_STRATEGIST_RESPONSE,
+    "architect": STUB_ARCHITECT_RESPONSE,
+    "ux_writer": STUB_UX_WRITER_RESPONSE,
+    "mockup_designer": STUB_MOCKUP_DESIGNER_RESPONSE,
+    "synthesizer": STUB_SYNTHESIZER_RESPONSE,
+}
 
 def get_stub_response(agent_name: str) -> str:
     """Get stub response for testing."""
-    responses = {
-        "strategist": STUB_STRATEGIST_RESPONSE,
-        "architect": STUB_ARCHITECT_RESPONSE,
-        "ux_writer": STUB_UX_WRITER_RESPONSE,
-        "mockup_designer": STUB_MOCKUP_DESIGNER_RESPONSE,
-        "synthesizer": STUB_SYNTHESIZER_RESPONSE,
-    }
-    
-    return responses.get(agent_name.lower(), "Stub response not available")
+    return _STUB_RESPONSES.get(agent_name.lower(), "Stub response not available")
@@ -1,36 +1,141 @@
 """Tests for the AI Product Manager backend."""
 
 import pytest
-import json
+import asyncio
+import io
 import os
+import sys
+import tempfile
+import zipfile
+import httpx
+import orjson
 from pathlib import Path
-from unittest.mock import Mock, AsyncMock, patch
 
 from core.models import Run, RunStatus, AgentRole
+from backend.app.api import runs as runs_api
+from backend.app.core.config import get_settings
+from backend.app.main import app
 from backend.services.storage import StorageService
 from core.orchestration import Orchestrator
 
 
-@pytest.fixture
-def storage_service(tmp_path):
-    """Create a storage service with temporary directory."""
-    return StorageService(base_data_dir=str(tmp_path))
+# Scripted LLM responses for a full agent workflow, built once
+_MOCKUP_JSON = '{"product_name":"Test Product","screens":[{"name":"Dashboard","route":"/","layout":"dashboard","components":[]}]}'
+_RUN_AGENT_RESPONSES = (
+    "Strategist response",
+    "Architect response",
+    "UX Writer response",
+    _MOCKUP_JSON,
+    "# Test PRD\n## Execution Plan\nTest execution plan"
+)
+_INVALID_JSON_RESPONSES = (
+    "Strategist response",
+    "Architect response",
+    "UX Writer response",
+    "Invalid JSON response",  # Mockup designer returns non-JSON
+    "# Test PRD"
+)
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """Create one event loop for all async tests, using uvloop when available."""
+    try:
+        import uvloop
+        loop = uvloop.new_event_loop()
+    except ImportError:
+        loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def storage_service(tmp_path_factory):
+    """Create a storage service with a temporary directory, shared by all tests."""
+    # Every run gets a unique ID, so tests sharing the service don't collide;
+    # bundles skip compression work, which the tests don't need
+    if os.access("/dev/shm", os.W_OK):
+        # Keep run files on tmpfs where available, so tests never hit the disk
+        with tempfile.TemporaryDirectory(prefix="storage-", dir="/dev/shm") as base_data_dir:
+            yield StorageService(base_data_dir=base_data_dir, bundle_compress_level=0)
+    else:
+        yield StorageService(base_data_dir=str(tmp_path_factory.mktemp("storage")), bundle_compress_level=0)
+
+
+class _FakeLLM:
+    """LLM client that returns scripted responses in order."""
+    
+    def __init__(self):
+        self._responses = []
+        self._i = 0
+    
+    def set_responses(self, responses):
+        """Script the responses for the next generate() calls."""
+        self._responses = responses
+        self._i = 0
+    
+    def generate(self, prompt, agent_name, **kwargs):
+        """Return the next scripted response as an already-resolved future."""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(self._responses[self._i])
+        self._i += 1
+        return future
 
 
 @pytest.fixture
-def mock_llm_client():
-    """Create a mock LLM client."""
-    client = Mock()
-    client.generate = AsyncMock()
-    return client
+def make_orchestrator(storage_service):
+    """Create orchestrators with a scripted fake LLM client and test storage."""
+    def make(responses):
+        llm_client = _FakeLLM()
+        llm_client.set_responses(responses)
+        orchestrator = Orchestrator(llm_client=llm_client)
+        orchestrator.storage = storage_service
+        return orchestrator
+    return make
+
+
+@pytest.fixture(scope="class")
+def sample_run(storage_service):
+    """Create one run shared by tests that only need some run to exist."""
+    return storage_service.create_run("Test idea")
+
+
+class _FakeRedis:
+    """In-memory stand-in for the async Redis client."""
+    
+    def __init__(self):
+        self.data = {}
+    
+    async def get(self, key):
+        return self.data.get(key)
+    
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+    
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+class _FakeSyncRedis:
+    """In-memory stand-in for the sync Redis client, sharing a _FakeRedis's data."""
+    
+    def __init__(self, data):
+        self.data = data
+    
+    def delete(self, key):
+        self.data.pop(key, None)
 
 
 @pytest.fixture
-def orchestrator(mock_llm_client, storage_service):
-    """Create an orchestrator with mock LLM client and test storage."""
-    orchestrator = Orchestrator(llm_client=mock_llm_client)
-    orchestrator.storage = storage_service
-    return orchestrator
+def api_client(storage_service, monkeypatch):
+    """Create an HTTP client for the app, with the runs API on the test storage."""
+    monkeypatch.setattr(runs_api, "storage", storage_service)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def _read_zip(path):
+    """Open a zip from a single read of the file, so member checks never go back to disk."""
+    return zipfile.ZipFile(io.BytesIO(Path(path).read_bytes()))
 
 
 class TestStorageService:
@@ -53,23 +158,158 @@ class TestStorageService:
         assert "bundle" in run.artifacts
         
         # Check that run directory was created
-        run_dir = Path(storage_service.runs_dir) / run.id
+        run_dir = storage_service.run_dir(run.id)
         assert run_dir.exists()
         assert (run_dir / "run.json").exists()
     
-    def test_get_run(self, storage_service):
+    def test_get_run(self, storage_service, sample_run):
         """Test retrieving a run by ID."""
-        idea = "Test product idea"
-        created_run = storage_service.create_run(idea)
-        
-        retrieved_run = storage_service.get_run(created_run.id)
+        retrieved_run = storage_service.get_run(sample_run.id)
         assert retrieved_run is not None
-        assert retrieved_run.id == created_run.id
-        assert retrieved_run.idea == idea
+        assert retrieved_run.id == sample_run.id
+        assert retrieved_run.idea == sample_run.idea
     
-    def test_save_artifact(self, storage_service):
-        """Test saving an artifact."""
+    def test_run_cache_is_bounded(self, tmp_path):
+        """Test that evicted runs are reloaded from disk."""
+        storage_service = StorageService(base_data_dir=str(tmp_path), cache_size=1)
+        first = storage_service.create_run("First idea")
+        second = storage_service.create_run("Second idea")
+        
+        assert len(storage_service._runs_cache) == 1
+        assert storage_service.get_run(first.id).idea == "First idea"
+        assert storage_service.get_run(second.id).idea == "Second idea"
+    
+    @pytest.mark.asyncio
+    async def test_update_run_async(self, storage_service):
+        """Test that async updates round-trip through disk."""
+        run = await storage_service.create_run_async("Test idea")
+        run.add_message(role=AgentRole.STRATEGIST, content="Strategist response", step=1)
+        assert await storage_service.update_run_async(run) is True
+        
+        # A fresh service has an empty cache, so this reads run.json from disk
+        reloaded = await StorageService(base_data_dir=str(storage_service.base_data_dir)).get_run_async(run.id)
+        assert reloaded is not None
+        assert reloaded.created_at == run.created_at
+        assert reloaded.messages[0].content == "Strategist response"
+        assert reloaded.messages[0].role == AgentRole.STRATEGIST
+    
+    @pytest.mark.asyncio
+    async def test_corrupt_redis_entry_is_a_miss(self, tmp_path):
+        """Test that an unreadable Redis entry falls back to disk and is replaced."""
+        storage_service = StorageService(base_data_dir=str(tmp_path), redis_url="redis://unused")
+        storage_service._redis = _FakeRedis()
+        run = await storage_service.create_run_async("Test idea")
+        key = next(iter(storage_service._redis.data))
+        storage_service._redis.data[key] = b'{"id": "old schema"}'
+        storage_service._runs_cache.clear()
+        
+        loaded = await storage_service.get_run_async(run.id)
+        assert loaded is not None
+        assert loaded.idea == "Test idea"
+        assert orjson.loads(storage_service._redis.data[key])["idea"] == "Test idea"
+    
+    @pytest.mark.asyncio
+    async def test_sync_updates_invalidate_redis(self, tmp_path):
+        """Test that sync mutators drop the run from Redis so async reads see the change."""
+        storage_service = StorageService(base_data_dir=str(tmp_path), redis_url="redis://unused")
+        storage_service._redis = _FakeRedis()
+        storage_service._sync_redis = _FakeSyncRedis(storage_service._redis.data)
+        run = await storage_service.create_run_async("Test idea")
+        assert storage_service._redis.data
+        
+        run.update_status(RunStatus.RUNNING)
+        assert storage_service.update_run(run) is True
+        assert not storage_service._redis.data
+        
+        # Another worker, with nothing in its own cache, reads the update
+        storage_service._runs_cache.clear()
+        assert (await storage_service.get_run_async(run.id)).status == RunStatus.RUNNING
+        
+        message = run.add_message(role=AgentRole.STRATEGIST, content="Strategist response", step=1)
+        assert storage_service.append_message(run.id, message) is True
+        assert not storage_service._redis.data
+    
+    @pytest.mark.asyncio
+    async def test_append_message(self, storage_service):
+        """Test that logged messages are merged into run.json on load."""
+        run = await storage_service.create_run_async("Test idea")
+        first = run.add_message(role=AgentRole.STRATEGIST, content="Strategist response", step=1)
+        assert await storage_service.append_message_async(run.id, first) is True
+        
+        # Messages only in the log still load, and bump updated_at
+        reloaded = await StorageService(base_data_dir=str(storage_service.base_data_dir)).get_run_async(run.id)
+        assert [m.content for m in reloaded.messages] == ["Strategist response"]
+        assert reloaded.updated_at == first.timestamp
+        
+        # Once run.json holds them too, they are not duplicated
+        second = run.add_message(role=AgentRole.ARCHITECT, content="Architect response", step=2)
+        assert await storage_service.append_message_async(run.id, second) is True
+        assert await storage_service.update_run_async(run) is True
+        reloaded = StorageService(base_data_dir=str(storage_service.base_data_dir)).get_run(run.id)
+        assert [m.content for m in reloaded.messages] == ["Strategist response", "Architect response"]
+    
+    @pytest.mark.asyncio
+    async def test_partial_message_log_line(self, storage_service):
+        """Test that a half-written last line of the message log is skipped on load."""
+        run = await storage_service.create_run_async("Test idea")
+        message = run.add_message(role=AgentRole.STRATEGIST, content="Strategist response", step=1)
+        assert await storage_service.append_message_async(run.id, message) is True
+        with open(storage_service.run_dir(run.id) / "messages.jsonl", "ab") as f:
+            f.write(b'{"id": "cut-off", "role": "archi')
+        
+        reloaded = await StorageService(base_data_dir=str(storage_service.base_data_dir)).get_run_async(run.id)
+        assert reloaded is not None
+        assert [m.content for m in reloaded.messages] == ["Strategist response"]
+        reloaded = StorageService(base_data_dir=str(storage_service.base_data_dir)).get_run(run.id)
+        assert [m.content for m in reloaded.messages] == ["Strategist response"]
+    
+    def test_update_run_is_atomic(self, storage_service, monkeypatch):
+        """Test that a failed save leaves the previous run.json intact."""
         run = storage_service.create_run("Test idea")
+        run_dir = storage_service.run_dir(run.id)
+        before = (run_dir / "run.json").read_bytes()
+        
+        def fail_replace(src, dst):
+            raise OSError("disk full")
+        
+        monkeypatch.setattr(os, "replace", fail_replace)
+        run.update_status(RunStatus.RUNNING)
+        assert storage_service.update_run(run) is False
+        
+        assert (run_dir / "run.json").read_bytes() == before
+        assert not list(run_dir.glob("*.tmp"))
+    
+    def test_list_runs(self, tmp_path, monkeypatch):
+        """Test listing runs newest first from the run index."""
+        # Own directory, so other tests' runs don't show up in the listing
+        storage_service = StorageService(base_data_dir=str(tmp_path))
+        assert not storage_service.runs_dir.exists()
+        runs = [storage_service.create_run(f"Idea {i}") for i in range(5)]
+        
+        # Force several backwards reads across partial lines
+        monkeypatch.setattr(sys.modules[StorageService.__module__], "_INDEX_CHUNK_SIZE", 16)
+        listed = storage_service.list_runs(limit=2, offset=1)
+        assert [r.id for r in listed] == [runs[3].id, runs[2].id]
+        
+        # A missing index is rebuilt from the run directories
+        (storage_service.runs_dir / "_index.jsonl").unlink()
+        rebuilt = StorageService(base_data_dir=str(storage_service.base_data_dir))
+        assert [r.id for r in rebuilt.list_runs(limit=10)] == [r.id for r in reversed(runs)]
+    
+    @pytest.mark.asyncio
+    async def test_first_run_is_indexed_once(self, tmp_path):
+        """Test that the first run on a fresh data dir is listed once."""
+        storage_service = StorageService(base_data_dir=str(tmp_path / "sync"))
+        run = storage_service.create_run("Test idea")
+        assert [r.id for r in storage_service.list_runs()] == [run.id]
+        
+        storage_service = StorageService(base_data_dir=str(tmp_path / "async"))
+        run = await storage_service.create_run_async("Test idea")
+        assert [r.id for r in await storage_service.list_runs_async()] == [run.id]
+    
+    def test_save_artifact(self, storage_service, sample_run):
+        """Test saving an artifact."""
+        run = sample_run
         artifact_content = "Test artifact content"
         
         success = storage_service.save_artifact(run.id, "prd_markdown", artifact_content)
@@ -78,48 +318,80 @@ class TestStorageService:
         # Check that artifact file was created
         artifact_path = Path(run.get_artifact_path("prd_markdown"))
         assert artifact_path.exists()
-        assert artifact_path.read_text() == artifact_content
+        assert artifact_path.read_bytes() == artifact_content.encode()
     
-    def test_create_bundle(self, storage_service):
-        """Test creating a bundle zip file."""
+    def test_save_artifact_large_payload(self, storage_service):
+        """Test saving a large structured conversation in one encode and write."""
         run = storage_service.create_run("Test idea")
+        conversation = {
+            "id": run.id,
+            "messages": [{"role": "strategist", "content": "x" * 100, "step": i} for i in range(1000)]
+        }
+        
+        assert storage_service.save_artifact(run.id, "conversation", conversation) is True
         
-        # Create some artifacts
-        storage_service.save_artifact(run.id, "prd_markdown", "# Test PRD")
-        storage_service.save_artifact(run.id, "conversation", '{"test": "data"}')
+        artifact_path = Path(run.get_artifact_path("conversation"))
+        assert orjson.loads(artifact_path.read_bytes()) == conversation
+    
+    def test_create_bundle(self, storage_service, sample_run):
+        """Test creating a bundle zip file."""
+        run = sample_run
+        
+        # Create some artifacts directly; saving is covered by test_save_artifact
+        Path(run.get_artifact_path("prd_markdown")).write_bytes(b"# Test PRD")
+        Path(run.get_artifact_path("conversation")).write_bytes(b'{"test": "data"}')
+        Path(run.get_artifact_path("prd_pdf")).write_bytes(b"%PDF-1.4 test")
         
         bundle_path = storage_service.create_bundle(run.id)
         assert bundle_path is not None
         assert Path(bundle_path).exists()
         assert bundle_path.endswith(".zip")
+        
+        with _read_zip(bundle_path) as zipf:
+            assert {"PRD.md", "PRD.pdf", "conversation.json", "run.json"} <= set(zipf.namelist())
+            assert zipf.read("PRD.md") == b"# Test PRD"
+            
+            # Already-compressed entries are stored, text is deflated
+            assert zipf.getinfo("PRD.pdf").compress_type == zipfile.ZIP_STORED
+            assert zipf.getinfo("PRD.md").compress_type == zipfile.ZIP_DEFLATED
+    
+    @pytest.mark.asyncio
+    async def test_iter_bundle(self, storage_service):
+        """Test streaming a bundle zip without writing it to disk."""
+        run = storage_service.create_run("Test idea")
+        Path(run.get_artifact_path("prd_markdown")).write_bytes(b"# Test PRD")
+        
+        data = b"".join([chunk async for chunk in storage_service.iter_bundle(run.id)])
+        
+        with zipfile.ZipFile(io.BytesIO(data)) as zipf:
+            names = set(zipf.namelist())
+            assert zipf.read("PRD.md") == b"# Test PRD"
+        assert "run.json" in names
+        assert not Path(run.get_artifact_path("bundle")).exists()
 
 
 class TestOrchestrator:
     """Test orchestrator functionality."""
     
     @pytest.mark.asyncio
-    async def test_run_agents(self, orchestrator, storage_service, mock_llm_client):
-        """Test running the full agent workflow."""
-        # Mock LLM responses
-        mock_llm_client.generate.side_effect = [
-            "Strategist response",
-            "Architect response", 
-            "UX Writer response",
-            json.dumps({
-                "product_name": "Test Product",
-                "screens": [{"name": "Dashboard", "route": "/", "layout": "dashboard", "components": []}]
-            }),
-            "# Test PRD\n## Execution Plan\nTest execution plan"
-        ]
+    async def test_run_agents(self, make_orchestrator, storage_service):
+        """Test the full agent workflow, with valid and invalid mockup JSON runs side by side."""
+        orchestrator = make_orchestrator(_RUN_AGENT_RESPONSES)
+        invalid_json_orchestrator = make_orchestrator(_INVALID_JSON_RESPONSES)
         
-        # Create a run
+        # Create the runs
         run = storage_service.create_run("Test product idea")
+        invalid_json_run = storage_service.create_run("Test product idea")
         
-        # Run agents
-        result = await orchestrator.run_agents(run.id)
+        # Run both workflows concurrently
+        result, invalid_json_result = await asyncio.gather(
+            orchestrator.run_agents(run.id),
+            invalid_json_orchestrator.run_agents(invalid_json_run.id)
+        )
         
-        # Check that run was completed
+        # Check that both runs were completed
         assert result.status == RunStatus.COMPLETED
+        assert invalid_json_result.status == RunStatus.COMPLETED
         assert len(result.messages) == 5
         
         # Check message roles
@@ -132,56 +404,143 @@ class TestOrchestrator:
             AgentRole.SYNTHESIZER
         ]
         
-        # Check that artifacts were created
-        run_dir = Path(storage_service.runs_dir) / run.id
-        assert (run_dir / "PRD.md").exists()
-        assert (run_dir / "mockup.json").exists()
-        assert (run_dir / "conversation.json").exists()
+        # Check that artifacts were created, reading each run directory once
+        files = {p.name: p.read_bytes() for p in storage_service.run_dir(run.id).iterdir()}
+        assert {"PRD.md", "mockup.json", "conversation.json"} <= files.keys()
+        
+        # run.json holds every message, so the message log is gone
+        assert "messages.jsonl" not in files
+        assert len(orjson.loads(files["run.json"])["messages"]) == 5
         
         # Check that PRD contains execution plan
-        prd_content = (run_dir / "PRD.md").read_text()
-        assert "Execution Plan" in prd_content
+        assert b"Execution Plan" in files["PRD.md"]
         
         # Check that mockup.json is valid JSON
-        mockup_content = (run_dir / "mockup.json").read_text()
-        mockup_data = json.loads(mockup_content)
+        mockup_data = orjson.loads(files["mockup.json"])
         assert "product_name" in mockup_data
         assert "screens" in mockup_data
+        
+        # Check that the invalid mockup JSON was saved as text
+        invalid_json_files = {p.name: p.read_bytes() for p in storage_service.run_dir(invalid_json_run.id).iterdir()}
+        assert invalid_json_files["mockup.json"] == b"Invalid JSON response"
+
+
+class TestRunsAPI:
+    """Test the runs API endpoints."""
     
     @pytest.mark.asyncio
-    async def test_mockup_designer_invalid_json(self, orchestrator, storage_service, mock_llm_client):
-        """Test mockup designer with invalid JSON response."""
-        # Mock LLM responses with invalid JSON
-        mock_llm_client.generate.side_effect = [
-            "Strategist response",
-            "Architect response",
-            "UX Writer response",
-            "Invalid JSON response",  # Mockup designer returns non-JSON
-            "# Test PRD"
-        ]
+    async def test_create_run_sheds_load(self, api_client, monkeypatch):
+        """Test that a burst of new runs past the limits gets 429 and finished runs free their slot."""
+        # Hold every accepted run in its slot until released
+        release = asyncio.Event()
         
-        # Create a run
-        run = storage_service.create_run("Test product idea")
+        async def hold_slot(run_id):
+            await release.wait()
         
-        # Run agents
-        result = await orchestrator.run_agents(run.id)
+        monkeypatch.setattr(runs_api, "run_agents_background", hold_slot)
+        monkeypatch.setattr(get_settings(), "max_concurrent_runs", 1)
+        monkeypatch.setattr(get_settings(), "max_queued_runs", 0)
         
-        # Check that run was completed
-        assert result.status == RunStatus.COMPLETED
+        async with api_client as client:
+            responses = await asyncio.gather(*(
+                client.post("/api/v1/runs", json={"idea": "Test idea"}) for _ in range(10)
+            ))
+            assert sorted(r.status_code for r in responses) == [200] + [429] * 9
+            
+            # Once the running workflow ends, its slot is free again
+            release.set()
+            await asyncio.gather(*runs_api._run_tasks)
+            response = await client.post("/api/v1/runs", json={"idea": "Test idea"})
+            assert response.status_code == 200
+            await asyncio.gather(*runs_api._run_tasks)
         
-        # Check that mockup.json was saved as text
-        run_dir = Path(storage_service.runs_dir) / run.id
-        assert (run_dir / "mockup.json").exists()
+        assert runs_api._run_counts["pending"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_get_run_etag(self, api_client, storage_service):
+        """Test that polling a run returns 304 until its state changes."""
+        run = storage_service.create_run("Test idea")
+        url = f"/api/v1/runs/{run.id}"
         
-        mockup_content = (run_dir / "mockup.json").read_text()
-        assert mockup_content == "Invalid JSON response"
-
-
-def test_api_endpoints():
-    """Test that API endpoints are properly configured."""
-    # This is a placeholder for actual API endpoint tests
-    # In a real test suite, we would use TestClient to test FastAPI endpoints
-    pass
+        async with api_client as client:
+            response = await client.get(url)
+            assert response.status_code == 200
+            assert orjson.loads(response.content)["id"] == run.id
+            etag = response.headers["etag"]
+            
+            response = await client.get(url, headers={"If-None-Match": etag})
+            assert response.status_code == 304
+            assert response.content == b""
+            
+            run.update_status(RunStatus.RUNNING)
+            storage_service.update_run(run)
+            response = await client.get(url, headers={"If-None-Match": etag})
+            assert response.status_code == 200
+            assert response.headers["etag"] != etag
+    
+    @pytest.mark.asyncio
+    async def test_get_artifact(self, api_client, storage_service):
+        """Test serving an artifact as a file or wrapped in JSON, with conditional requests."""
+        run = storage_service.create_run("Test idea")
+        Path(run.get_artifact_path("prd_markdown")).write_bytes(b"# Test PRD")
+        url = f"/api/v1/runs/{run.id}/artifacts/prd_markdown"
+        
+        async with api_client as client:
+            response = await client.get(url)
+            assert response.status_code == 200
+            assert response.content == b"# Test PRD"
+            assert response.headers["content-type"].startswith("text/markdown")
+            etag = response.headers["etag"]
+            assert (await client.get(url, headers={"If-None-Match": etag})).status_code == 304
+            
+            # The wrapped form has its own ETag
+            response = await client.get(url, params={"wrap": 1}, headers={"If-None-Match": etag})
+            assert response.status_code == 200
+            assert orjson.loads(response.content)["content"] == "# Test PRD"
+            assert response.headers["etag"] != etag
+            
+            response = await client.get(f"/api/v1/runs/{run.id}/artifacts/mockup_json")
+            assert response.status_code == 404
+    
+    @pytest.mark.asyncio
+    async def test_download(self, api_client, storage_service):
+        """Test that completed runs get a saved bundle and in-progress runs a streamed one."""
+        in_progress = storage_service.create_run("Test idea")
+        completed = storage_service.create_run("Test idea")
+        for run in (in_progress, completed):
+            Path(run.get_artifact_path("prd_markdown")).write_bytes(b"# Test PRD")
+        completed.update_status(RunStatus.COMPLETED)
+        storage_service.update_run(completed)
+        
+        async with api_client as client:
+            for run in (in_progress, completed):
+                response = await client.get(f"/api/v1/runs/{run.id}/download")
+                assert response.status_code == 200
+                assert f"{run.id}.zip" in response.headers["content-disposition"]
+                with zipfile.ZipFile(io.BytesIO(response.content)) as zipf:
+                    assert zipf.read("PRD.md") == b"# Test PRD"
+        
+        assert not Path(in_progress.get_artifact_path("bundle")).exists()
+        assert Path(completed.get_artifact_path("bundle")).exists()
+    
+    @pytest.mark.asyncio
+    async def test_download_rebuilds_stale_bundle(self, api_client, storage_service):
+        """Test that a bundle built before the run completed is rebuilt on download."""
+        run = storage_service.create_run("Test idea")
+        prd_path = Path(run.get_artifact_path("prd_markdown"))
+        prd_path.write_bytes(b"# Draft PRD")
+        bundle_path = storage_service.create_bundle(run.id)
+        os.utime(bundle_path, (1, 1))
+        
+        prd_path.write_bytes(b"# Final PRD")
+        run.update_status(RunStatus.COMPLETED)
+        storage_service.update_run(run)
+        
+        async with api_client as client:
+            response = await client.get(f"/api/v1/runs/{run.id}/download")
+        assert response.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(response.content)) as zipf:
+            assert zipf.read("PRD.md") == b"# Final PRD"
 
 
 if __name__ == "__main__":